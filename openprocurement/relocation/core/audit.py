@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from Queue import Queue, Empty, Full
+from threading import Thread, Lock
+from time import time
+from uuid import uuid4
+
+from couchdb.design import ViewDefinition
+from openprocurement.api.models import get_now
+
+LOGGER = getLogger(__name__)
+
+# ownership history of object (or item of object) by location and date
+changes_by_location_view = ViewDefinition('changes', 'by_location', '''function(doc) {
+    if(doc.doc_type == 'OwnershipChange') {
+        emit([doc.location, doc.date], null);
+    }
+}''')
+
+# ownership changes from or to broker by date
+changes_by_owner_view = ViewDefinition('changes', 'by_owner', '''function(doc) {
+    if(doc.doc_type == 'OwnershipChange') {
+        emit([doc.owner, doc.date], null);
+        if(doc.previousOwner && doc.previousOwner != doc.owner) {
+            emit([doc.previousOwner, doc.date], null);
+        }
+    }
+}''')
+
+VIEWS = [changes_by_location_view, changes_by_owner_view]
+
+
+def changes_by_location_map(doc):
+    if doc.get('doc_type') == 'OwnershipChange':
+        yield [doc.get('location'), doc.get('date')], None
+
+
+def changes_by_owner_map(doc):
+    if doc.get('doc_type') == 'OwnershipChange':
+        yield [doc.get('owner'), doc.get('date')], None
+        if doc.get('previousOwner') and doc['previousOwner'] != doc.get('owner'):
+            yield [doc['previousOwner'], doc.get('date')], None
+
+
+# python equivalents of views for MemoryDatabase
+MAP_FUNCTIONS = {
+    'changes/by_location': changes_by_location_map,
+    'changes/by_owner': changes_by_owner_map,
+}
+
+
+class OwnershipAuditLog(object):
+    """ Write-behind append-only history of ownership changes
+
+    Records are put into bounded queue and written to separate database
+    by background thread with bulk requests of up to `batch` records at
+    least every `interval` seconds, so requests don't wait for the
+    database. Records are dropped (and counted in metrics) when the
+    queue is full or the write fails, and records still queued are lost
+    when the process exits.
+    """
+
+    def __init__(self, registry, db_name, size=10000, batch=100, interval=1.0):
+        self.registry = registry
+        self.db_name = db_name
+        self.queue = Queue(size)
+        self.batch = batch
+        self.interval = interval
+        self.db = None
+        self.thread = None
+        self.lock = Lock()
+
+    @classmethod
+    def from_settings(cls, registry, settings):
+        """ Audit log or None if `relocation.audit.db_name` is not configured """
+        if not settings.get('relocation.audit.db_name'):
+            return
+        return cls(registry, settings['relocation.audit.db_name'],
+                   size=int(settings.get('relocation.audit.queue_size', 10000)),
+                   batch=int(settings.get('relocation.audit.batch', 100)),
+                   interval=float(settings.get('relocation.audit.interval', 1)))
+
+    @property
+    def database(self):
+        if self.db is None:
+            server = self.registry.couchdb_server
+            db = server[self.db_name] if self.db_name in server else server.create(self.db_name)
+            ViewDefinition.sync_many(db, VIEWS)
+            self.db = db
+        return self.db
+
+    def count(self, result, amount=1):
+        self.registry.transfer_metrics['relocation_audit_records_total'].inc(amount, result=result)
+
+    def record(self, entry):
+        """ Queue record without waiting """
+        self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except Full:
+            self.count('dropped')
+            LOGGER.warning('Ownership audit queue is full, dropped record of {}'.format(entry['location']),
+                           extra={'MESSAGE_ID': 'relocation_audit_dropped'})
+
+    def start(self):
+        # started lazily, so worker processes forked after configuration get their own thread
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self.run, name='relocation-audit')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def take(self):
+        """ Wait for records, return up to `batch` records collected within `interval` """
+        entries = [self.queue.get()]
+        deadline = time() + self.interval
+        while len(entries) < self.batch:
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            try:
+                entries.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return entries
+
+    def write(self, entries):
+        try:
+            results = self.database.update(entries)
+        except Exception, e:
+            self.count('failed', len(entries))
+            LOGGER.error('Failed to write {} ownership audit records: {}'.format(len(entries), e),
+                         extra={'MESSAGE_ID': 'relocation_audit_failed'})
+            return
+        written = len([i for i in results if i[0]])
+        self.count('written', written)
+        if written < len(entries):
+            self.count('failed', len(entries) - written)
+
+    def run(self):
+        while True:
+            entries = self.take()
+            try:
+                self.write(entries)
+            finally:
+                for _ in entries:
+                    self.queue.task_done()
+
+    def flush(self):
+        """ Wait until queued records are written """
+        self.queue.join()
+
+
+def record_ownership_change(request, transfer_id, location, previous_owner, owner):
+    """ Add ownership change to audit log if it is configured
+    :param request:
+    :param transfer_id: id of applied transfer
+    :param location: location of item
+    :param previous_owner: owner of item before the change
+    :param owner: new owner of item
+    """
+    audit = request.registry.ownership_audit
+    if audit is None:
+        return
+    audit.record({
+        '_id': uuid4().hex,
+        'doc_type': 'OwnershipChange',
+        'transfer': transfer_id,
+        'location': location,
+        'previousOwner': previous_owner,
+        'owner': owner,
+        'date': get_now().isoformat(),
+    })
+
+
+def record_saved_ownership_change(request, transfer_id, location, previous_owner, owner):
+    """ Add ownership change to audit log when response to request is
+    successful, i.e. after the object was saved by the view of plugin
+    """
+    if request.registry.ownership_audit is None:
+        return
+
+    def record(request, response):
+        if response.status_int < 400:
+            record_ownership_change(request, transfer_id, location, previous_owner, owner)
+    request.add_response_callback(record)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+def rev_number(rev):
+    """ Numeric part of CouchDB revision (e.g. 3 for '3-a1b2...') """
+    try:
+        return int(rev.split('-', 1)[0])
+    except (AttributeError, ValueError):
+        return 0
+
+
+class CacheBackend(object):
+    """ Storage interface of TransferCache
+
+    Shared backends (memcached, redis, etc.) should implement the same
+    methods and provide `from_settings` constructor.
+    """
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    """ In-process LRU storage with per-item expiration """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(size=int(settings.get('relocation.cache.size', 1000)))
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None:
+                return
+            expires, value = item
+            if expires < time():
+                return
+            self.items[key] = item
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = (time() + ttl, value)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class TransferCache(object):
+    """ Read-through cache of transfer documents keyed by id and `_rev`
+
+    Revisions are compared only with documents written through the same
+    cache, reads don't check the stored revision. Entries of in-process
+    backends are replaced by writes of their process only, and documents
+    changed by other processes are served until `ttl` expires.
+    """
+
+    def __init__(self, backend, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, transfer_id):
+        """ Get cached transfer document
+        :param transfer_id:
+        :return: copy of document or None
+        """
+        doc = self.backend.get(transfer_id)
+        if doc is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        return dict(doc)
+
+    def set(self, doc):
+        """ Cache transfer document unless newer revision is already cached
+        :param doc: transfer as dict
+        :return: None
+        """
+        cached = self.backend.get(doc['_id'])
+        if cached is not None and rev_number(cached.get('_rev')) > rev_number(doc.get('_rev')):
+            return
+        self.backend.set(doc['_id'], dict(doc), self.ttl)
+
+    def invalidate(self, transfer_id):
+        self.backend.delete(transfer_id)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import json
+from calendar import timegm
+from couchdb.design import ViewDefinition
+from iso8601 import parse_date
+from couchdb.http import ResourceConflict
+from openprocurement.api import design
+
+
+FIELDS = [
+    'usedFor',
+]
+
+
+def add_design():
+    for i, j in globals().items():
+        if "_view" in i:
+            setattr(design, i, j)
+
+
+def sync_design_subscriber(event):
+    sync_update_handlers(event.app.registry.db)
+
+
+def sync_update_handlers(db):
+    """ Store update handlers in design documents
+
+    ViewDefinition doesn't manage update handlers, so they are synced
+    separately (views of the same design documents are kept intact).
+    """
+    for name, updates in UPDATE_HANDLERS.items():
+        doc_id = '_design/{}'.format(name)
+        doc = db.get(doc_id, {'_id': doc_id, 'language': 'javascript'})
+        if doc.get('updates') == updates:
+            continue
+        doc['updates'] = updates
+        try:
+            db.save(doc)
+        except ResourceConflict:  # pragma: no cover
+            pass  # synced concurrently
+
+
+transfers_by_date_view = ViewDefinition('transfers', 'by_date', '''function(doc) {
+    if(doc.doc_type == 'Transfer') {
+        var fields=%s, data={};
+        for (var i in fields) {
+            if (doc[fields[i]]) {
+                data[fields[i]] = doc[fields[i]]
+            }
+        }
+        emit(doc.date, data);
+    }
+}''' % FIELDS)
+
+
+transfers_by_owner_view = ViewDefinition('transfers', 'by_owner', '''function(doc) {
+    if(doc.doc_type == 'Transfer') {
+        emit([doc.owner, !doc.usedFor, doc.date], null);
+    }
+}''')
+
+
+transfers_by_usedFor_view = ViewDefinition('transfers', 'by_usedFor', '''function(doc) {
+    if(doc.doc_type == 'Transfer' && doc.usedFor) {
+        emit([doc.usedFor, doc.date], null);
+    }
+}''')
+
+
+# unused transfers by expiration time (milliseconds since epoch, so dates
+# with different UTC offsets are ordered correctly)
+transfers_by_expiresAt_view = ViewDefinition('transfers', 'by_expiresAt', '''function(doc) {
+    if(doc.doc_type == 'Transfer' && doc.expiresAt && !doc.usedFor) {
+        emit(Date.parse(doc.expiresAt.replace(/(\\.\\d{3})\\d+/, '$1')), null);
+    }
+}''')
+
+
+# Marks transfer as used for object location in one request. Request body:
+# {"usedFor": location or null, "date": isoformat, "now": milliseconds since
+# epoch, "owner": optional owner the transfer must belong to, "rev": optional
+# expected revision}.
+# Responds with the updated document, new revision is in X-Couch-Update-NewRev
+transfers_use_update = '''function(doc, req) {
+    var data = JSON.parse(req.body);
+    var error = function(code, name, reason) {
+        return [null, {
+            code: code,
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({error: name, reason: reason})
+        }];
+    };
+    if (!doc || doc.doc_type != 'Transfer') {
+        return error(404, 'not_found', 'transfer');
+    }
+    if (data.rev && doc._rev != data.rev) {
+        return error(409, 'conflict', 'Document update conflict.');
+    }
+    if (data.owner && doc.owner != data.owner) {
+        return error(403, 'forbidden', 'Only owner is allowed to generate new credentials.');
+    }
+    if (data.usedFor && doc.usedFor && doc.usedFor != data.usedFor) {
+        return error(403, 'forbidden', 'Transfer already used');
+    }
+    if (data.usedFor && !doc.usedFor && doc.expiresAt &&
+            Date.parse(doc.expiresAt.replace(/(\\.\\d{3})\\d+/, '$1')) <= data.now) {
+        return error(403, 'forbidden', 'Transfer expired');
+    }
+    if (data.usedFor) {
+        doc.usedFor = data.usedFor;
+    } else {
+        delete doc.usedFor;
+    }
+    doc.date = data.date;
+    return [doc, {
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(doc)
+    }];
+}'''
+
+
+UPDATE_HANDLERS = {
+    'transfers': {
+        'use': transfers_use_update,
+    },
+}
+
+
+# Python equivalents of the functions above used by MemoryDatabase,
+# keep them in sync with javascript versions
+
+def transfers_by_date_map(doc):
+    if doc.get('doc_type') == 'Transfer':
+        yield doc.get('date'), dict([(i, doc[i]) for i in FIELDS if doc.get(i)])
+
+
+def transfers_by_owner_map(doc):
+    if doc.get('doc_type') == 'Transfer':
+        yield [doc.get('owner'), not doc.get('usedFor'), doc.get('date')], None
+
+
+def transfers_by_usedFor_map(doc):
+    if doc.get('doc_type') == 'Transfer' and doc.get('usedFor'):
+        yield [doc['usedFor'], doc.get('date')], None
+
+
+def timestamp(value):
+    """ Milliseconds since epoch of isoformat date or datetime """
+    if isinstance(value, basestring):
+        value = parse_date(value)
+    return timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+
+
+def transfers_by_expiresAt_map(doc):
+    if doc.get('doc_type') == 'Transfer' and doc.get('expiresAt') and not doc.get('usedFor'):
+        yield timestamp(doc['expiresAt']), None
+
+
+def transfers_use_update_function(doc, body):
+    data = json.loads(body)
+
+    def error(code, name, reason):
+        return None, {'code': code, 'body': json.dumps({'error': name, 'reason': reason})}
+
+    if not doc or doc.get('doc_type') != 'Transfer':
+        return error(404, 'not_found', 'transfer')
+    if data.get('rev') and doc['_rev'] != data['rev']:
+        return error(409, 'conflict', 'Document update conflict.')
+    if data.get('owner') and doc.get('owner') != data['owner']:
+        return error(403, 'forbidden', 'Only owner is allowed to generate new credentials.')
+    if data.get('usedFor') and doc.get('usedFor') and doc['usedFor'] != data['usedFor']:
+        return error(403, 'forbidden', 'Transfer already used')
+    if data.get('usedFor') and not doc.get('usedFor') and doc.get('expiresAt') and \
+            timestamp(doc['expiresAt']) <= data['now']:
+        return error(403, 'forbidden', 'Transfer expired')
+    if data.get('usedFor'):
+        doc['usedFor'] = data['usedFor']
+    else:
+        doc.pop('usedFor', None)
+    doc['date'] = data['date']
+    return doc, {'body': json.dumps(doc)}
+
+
+MAP_FUNCTIONS = {
+    'transfers/by_date': transfers_by_date_map,
+    'transfers/by_owner': transfers_by_owner_map,
+    'transfers/by_usedFor': transfers_by_usedFor_map,
+    'transfers/by_expiresAt': transfers_by_expiresAt_map,
+}
+
+UPDATE_FUNCTIONS = {
+    'transfers/use': transfers_use_update_function,
+}
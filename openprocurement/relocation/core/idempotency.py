@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+from hashlib import sha1
+from logging import getLogger
+
+from pyramid.path import DottedNameResolver
+from pyramid.response import Response
+
+from openprocurement.api.utils import context_unpack
+
+from openprocurement.relocation.core.cache import LRUCacheBackend
+
+LOGGER = getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+
+# POST requests creating transfers (/transfers) or changing ownership
+# (/relocation/ownership, /tenders/{id}/ownership, etc.)
+IDEMPOTENT_PATHS = re.compile(r'/(transfers|ownership)/?$')
+
+# responses which are not stored, retry of request may succeed
+TRANSIENT_STATUSES = (409, 429)
+
+PENDING = 'pending'
+
+
+class IdempotencyStore(object):
+    """ Responses of requests by broker and idempotency key
+
+    Keys expire after `ttl` seconds. Stored responses contain plain
+    tokens of created transfers, so shared backends must be private to
+    the application.
+    """
+
+    def __init__(self, backend, ttl=86400):
+        self.backend = backend
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ Store or None if `relocation.idempotency.size` or `relocation.idempotency.backend`
+        is not configured
+        """
+        if settings.get('relocation.idempotency.backend'):
+            backend = DottedNameResolver().maybe_resolve(settings['relocation.idempotency.backend'])
+            backend = backend.from_settings(settings)
+        elif settings.get('relocation.idempotency.size'):
+            backend = LRUCacheBackend(size=int(settings['relocation.idempotency.size']))
+        else:
+            return
+        return cls(backend, ttl=int(settings.get('relocation.idempotency.ttl', 86400)))
+
+    def get(self, key):
+        """ Stored (fingerprint, status, content type, body) or (fingerprint, PENDING) """
+        return self.backend.get(key)
+
+    def start(self, key, fingerprint):
+        """ Mark request as being processed """
+        self.backend.set(key, (fingerprint, PENDING), self.ttl)
+
+    def finish(self, key, fingerprint, response):
+        """ Store response of request, or forget request if response is
+        an error retry of which may succeed
+        """
+        if response is None or response.status_int >= 500 or response.status_int in TRANSIENT_STATUSES:
+            self.backend.delete(key)
+        else:
+            self.backend.set(key, (fingerprint, response.status_int, response.headers.get('Content-Type'),
+                                   response.body), self.ttl)
+
+
+def error_response(status, description):
+    return Response(
+        json.dumps({'status': 'error', 'errors': [{'location': 'header', 'name': HEADER,
+                                                   'description': description}]}),
+        status=status, content_type='application/json')
+
+
+def idempotency_tween_factory(handler, registry):
+    """ Answer retries of POST requests with the same `Idempotency-Key`
+    header from `registry.idempotency_store` without processing them again
+    """
+    store = registry.idempotency_store
+    replays = registry.transfer_metrics['relocation_idempotent_replays_total']
+
+    def idempotency_tween(request):
+        idempotency_key = request.headers.get(HEADER)
+        if not idempotency_key or request.method != 'POST' or not IDEMPOTENT_PATHS.search(request.path):
+            return handler(request)
+        key = '{}:{}:{}'.format(request.authenticated_userid, request.path, idempotency_key)
+        fingerprint = sha1(request.body).hexdigest()
+        stored = store.get(key)
+        if stored is not None:
+            if stored[0] != fingerprint:
+                return error_response(422, 'Key was used with different request.')
+            if stored[1] == PENDING:
+                return error_response(409, 'Request with the same key is in progress.')
+            replays.inc()
+            LOGGER.info('Replayed response of request with {} {}'.format(HEADER, idempotency_key),
+                        extra=context_unpack(request, {'MESSAGE_ID': 'relocation_idempotent_replay'}))
+            _, status, content_type, body = stored
+            response = Response(body, status=status)
+            if content_type:
+                response.headers['Content-Type'] = content_type
+            response.headers[HEADER] = idempotency_key
+            return response
+        store.start(key, fingerprint)
+        response = None
+        try:
+            response = handler(request)
+            return response
+        finally:
+            store.finish(key, fingerprint, response)
+    return idempotency_tween
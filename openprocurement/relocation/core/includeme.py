@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
 from logging import getLogger
+from time import time
+from pyramid.events import ApplicationCreated
+from pyramid.path import DottedNameResolver
+from pyramid.settings import asbool
 from pkg_resources import get_distribution, iter_entry_points
 
 PKG = get_distribution(__package__)
@@ -8,15 +13,97 @@ LOGGER = getLogger(PKG.project_name)
 
 
 def main(config):
-    from openprocurement.relocation.core.utils import (transfer_from_data, extract_transfer)
+    from openprocurement.relocation.core.utils import (
+        transfer_from_data, extract_transfer, extract_transfer_view, extract_transfers,
+        extract_transfers_by_location, get_transfer_revision
+    )
+    from openprocurement.relocation.core.cache import TransferCache, LRUCacheBackend
+    from openprocurement.relocation.core.design import add_design, sync_design_subscriber
+    from openprocurement.relocation.core.tokens import TokenVerifier, TokenPool
+    from openprocurement.relocation.core.storage import TransferStorage
+    from openprocurement.relocation.core.timing import TimingStats
+    from openprocurement.relocation.core.metrics import relocation_metrics
+    from openprocurement.relocation.core.models import clear_serializers
+    from openprocurement.relocation.core.ownership import add_ownership_resolver
+    from openprocurement.relocation.core.limits import rate_limiters_from_settings, WriteSlots
+    from openprocurement.relocation.core.idempotency import IdempotencyStore
+    from openprocurement.relocation.core.audit import OwnershipAuditLog
     LOGGER.info('Init relocation core plugin.')
     config.add_request_method(extract_transfer, 'transfer', reify=True)
+    config.add_request_method(extract_transfer_view, 'transfer_view', reify=True)
+    config.add_request_method(extract_transfers)
+    config.add_request_method(extract_transfers_by_location)
     config.add_request_method(transfer_from_data)
+    config.add_request_method(get_transfer_revision)
+    add_design()
+    config.add_subscriber(sync_design_subscriber, ApplicationCreated)
 
+    settings = config.registry.settings
+    config.registry.transfer_batch_limit = int(settings.get('relocation.batch_limit', 1000))
+    config.registry.transfer_ttl = None
+    if settings.get('relocation.expiry.days'):
+        config.registry.transfer_ttl = timedelta(days=float(settings['relocation.expiry.days']))
+    config.registry.rate_limiters = rate_limiters_from_settings(settings)
+    config.registry.transfer_write_slots = WriteSlots.from_settings(settings)
+    config.registry.token_verifier = TokenVerifier.from_settings(settings)
+    config.registry.token_pool = TokenPool.from_settings(config.registry.token_verifier, settings)
+    config.registry.transfer_metrics = relocation_metrics()
+    config.add_tween('openprocurement.relocation.core.metrics.metrics_tween_factory')
+    config.registry.transfer_storage = TransferStorage.from_settings(config.registry, settings)
+
+    config.registry.transfer_cache = None
+    # writes update the cache of their own process only. With the default
+    # in-process LRU backend other workers may read transfer documents
+    # (e.g. usedFor) up to `relocation.cache.ttl` seconds old, so shared
+    # backend or short ttl is needed with several workers. Conditional
+    # requests always confirm the revision with the database.
+    if settings.get('relocation.cache.size') or settings.get('relocation.cache.backend'):
+        backend = DottedNameResolver().maybe_resolve(settings.get('relocation.cache.backend', LRUCacheBackend))
+        config.registry.transfer_cache = TransferCache(backend.from_settings(settings),
+                                                       ttl=int(settings.get('relocation.cache.ttl', 60)))
+
+    config.registry.idempotency_store = IdempotencyStore.from_settings(settings)
+    if config.registry.idempotency_store:
+        config.add_tween('openprocurement.relocation.core.idempotency.idempotency_tween_factory')
+
+    config.registry.ownership_audit = OwnershipAuditLog.from_settings(config.registry, settings)
+    config.registry.ownership_resolvers = {}
+    config.add_directive('add_ownership_resolver', add_ownership_resolver)
+
+    config.registry.transfer_timings = TimingStats()
+    if asbool(settings.get('relocation.timings')):
+        config.add_tween('openprocurement.relocation.core.timing.timing_tween_factory')
+
+    start = time()
     config.scan("openprocurement.relocation.core.views")
+    LOGGER.info('Scanned relocation core views in {:.3f} s'.format(time() - start))
 
     plugins = config.registry.settings.get('plugins') and config.registry.settings['plugins'].split(',')
+    if load_plugins(config, plugins):
+        # plugins may extend models
+        clear_serializers()
+
+
+def load_plugins(config, plugins=None):
+    """ Load and configure relocation plugins
+    :param config: pyramid Configurator
+    :param plugins: names of plugins to load, all installed plugins by default
+    :return: names of loaded plugins
+    """
+    loaded = []
+    total = 0
     for entry_point in iter_entry_points('openprocurement.relocation.core.plugins'):
         if not plugins or entry_point.name in plugins:
-            plugin = entry_point.load()
+            start = time()
+            # import only, requirements of distributions are not resolved
+            # again (it is done by setuptools on installation)
+            plugin = entry_point.load(require=False)
+            imported = time()
             plugin(config)
+            loaded.append(entry_point.name)
+            total += time() - start
+            LOGGER.info('Loaded relocation plugin {}: import {:.3f} s, configure {:.3f} s'.format(
+                entry_point.name, imported - start, time() - imported))
+    if loaded:
+        LOGGER.info('Loaded {} relocation plugins in {:.3f} s'.format(len(loaded), total))
+    return loaded
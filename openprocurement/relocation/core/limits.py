@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from logging import getLogger
+from math import ceil
+from threading import Condition, Lock
+from time import time
+
+from pyramid.path import DottedNameResolver
+from openprocurement.api.utils import error_handler, context_unpack
+
+LOGGER = getLogger(__name__)
+
+# rate limited actions, settings are `relocation.rate_limit.<action>.rate`
+# (requests per second per broker) and `relocation.rate_limit.<action>.burst`
+RATE_LIMITED_ACTIONS = ('create_transfer', 'change_ownership')
+
+
+class RateLimitBackend(object):
+    """ Storage interface of token buckets of RateLimiter
+
+    Shared backends (memcached, redis, etc.) should implement the same
+    methods and provide `from_settings` constructor, so all application
+    processes share limits of a broker.
+    """
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def consume(self, key, cost, rate, burst):
+        """ Take `cost` tokens from bucket refilled with `rate` tokens per
+        second up to `burst` tokens
+        :return: 0 if tokens were taken, otherwise seconds to wait for them
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """ In-process token buckets """
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = Lock()
+
+    def consume(self, key, cost, rate, burst):
+        now = time()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < cost:
+                self.buckets[key] = (tokens, now)
+                return (cost - tokens) / float(rate)
+            self.buckets[key] = (tokens - cost, now)
+            return 0
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class RateLimiter(object):
+    """ Per broker token bucket limit of one action """
+
+    def __init__(self, action, backend, rate, burst=None):
+        self.action = action
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+
+    @classmethod
+    def from_settings(cls, action, backend, settings):
+        """ Limiter of action or None if it is not configured """
+        prefix = 'relocation.rate_limit.{}.'.format(action)
+        if not settings.get(prefix + 'rate'):
+            return
+        burst = settings.get(prefix + 'burst')
+        return cls(action, backend, float(settings[prefix + 'rate']), burst and float(burst))
+
+    def consume(self, userid, cost=1):
+        """ Seconds to wait before request of `cost` items is allowed, 0 if it is allowed now.
+        Request of more than `burst` items is never allowed.
+        """
+        return self.backend.consume('{}:{}'.format(self.action, userid), cost, self.rate, self.burst)
+
+
+def rate_limiters_from_settings(settings):
+    """ Rate limiters by action configured in settings """
+    backend = DottedNameResolver().maybe_resolve(
+        settings.get('relocation.rate_limit.backend', MemoryRateLimitBackend))
+    backend = backend.from_settings(settings)
+    limiters = {}
+    for action in RATE_LIMITED_ACTIONS:
+        limiter = RateLimiter.from_settings(action, backend, settings)
+        if limiter:
+            limiters[action] = limiter
+    return limiters
+
+
+def reject(request, status, name, description, retry_after=None):
+    request.errors.add('body', name, description)
+    request.errors.status = status
+    response = error_handler(request.errors)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(int(ceil(retry_after)))
+    raise response
+
+
+def check_rate_limit(request, action, cost=1):
+    """ Reject request with 429 Too Many Requests if broker exceeded
+    rate limit of action or batch is larger than burst of the limit
+    :param request:
+    :param action: one of RATE_LIMITED_ACTIONS
+    :param cost: number of items in request
+    """
+    limiter = request.registry.rate_limiters.get(action)
+    if limiter is None:
+        return
+    if cost > limiter.burst:
+        # retry would be rejected too, so there is no Retry-After
+        LOGGER.info('Batch of {} items exceeds rate limit of {} by {}'.format(
+            cost, action, request.authenticated_userid),
+                    extra=context_unpack(request, {'MESSAGE_ID': 'relocation_rate_limited'}))
+        reject(request, 429, 'data', 'Rate limit exceeded, batch must contain at most {} items.'.format(
+            int(limiter.burst)))
+    wait = limiter.consume(request.authenticated_userid, cost)
+    if wait:
+        LOGGER.info('Rate limit of {} exceeded by {}'.format(action, request.authenticated_userid),
+                    extra=context_unpack(request, {'MESSAGE_ID': 'relocation_rate_limited'}))
+        reject(request, 429, 'data', 'Rate limit exceeded.', wait)
+
+
+class WriteSlots(object):
+    """ Limit of concurrent writes of transfers and objects changing ownership """
+
+    def __init__(self, size, timeout=1.0):
+        self.size = size
+        self.timeout = timeout
+        self.used = 0
+        self.condition = Condition(Lock())
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ Slots or None if `relocation.writes.max_concurrent` is not configured """
+        size = int(settings.get('relocation.writes.max_concurrent', 0))
+        if size:
+            return cls(size, float(settings.get('relocation.writes.timeout', 1)))
+
+    def acquire(self):
+        """ Wait for free slot up to `timeout` seconds
+        :return: True if slot was acquired
+        """
+        deadline = time() + self.timeout
+        with self.condition:
+            while self.used >= self.size:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.used += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.used -= 1
+            self.condition.notify()
+
+
+@contextmanager
+def write_slot(request):
+    """ Hold one of concurrent write slots, reject request with
+    503 Service Unavailable if none is freed in time
+    """
+    slots = request.registry.transfer_write_slots
+    if slots is None:
+        yield
+        return
+    if not slots.acquire():
+        LOGGER.info('No free write slot', extra=context_unpack(request, {'MESSAGE_ID': 'relocation_write_rejected'}))
+        reject(request, 503, 'data', 'Too many concurrent writes.', slots.timeout)
+    try:
+        yield
+    finally:
+        slots.release()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+import json
+from copy import deepcopy
+from StringIO import StringIO
+from threading import RLock
+from uuid import uuid4
+
+from couchdb.client import Database, Document, Row
+from couchdb.http import ResourceConflict, ResourceNotFound, PreconditionFailed, ServerError
+
+from openprocurement.relocation.core.design import MAP_FUNCTIONS, UPDATE_FUNCTIONS
+
+
+def collate(value):
+    """ Sort key of JSON value following CouchDB view collation
+    (null, false, true, numbers, strings, arrays, objects).
+    Strings are compared by code points, not with ICU rules.
+    """
+    if value is None:
+        return (0,)
+    if value is False:
+        return (1,)
+    if value is True:
+        return (2,)
+    if isinstance(value, (int, long, float)):
+        return (3, value)
+    if isinstance(value, basestring):
+        return (4, unicode(value))
+    if isinstance(value, (list, tuple)):
+        return (5, tuple([collate(i) for i in value]))
+    return (6, tuple([(unicode(k), collate(v)) for k, v in value.items()]))
+
+
+def couch_error(status, error):
+    """ Exception raised by couchdb client for response status """
+    if status == 404:
+        return ResourceNotFound(error)
+    elif status == 409:
+        return ResourceConflict(error)
+    elif status == 412:
+        return PreconditionFailed(error)
+    return ServerError((status, error))
+
+
+class MemoryViewResults(list):
+
+    def __init__(self, rows, total_rows, offset):
+        super(MemoryViewResults, self).__init__(rows)
+        self.total_rows = total_rows
+        self.offset = offset
+
+    @property
+    def rows(self):
+        return list(self)
+
+
+class MemoryResource(object):
+    """ Subset of `couchdb.http.Resource` used with database resource """
+
+    def __init__(self, db):
+        self.db = db
+        self.url = 'memory:///{}'.format(db.name)
+        self.credentials = None
+
+    def head(self, path=None, headers=None, **params):
+        with self.db.lock:
+            if path not in self.db.docs:
+                raise ResourceNotFound(('not_found', 'missing'))
+            return 200, {'ETag': '"{}"'.format(self.db.docs[path]['_rev'])}, None
+
+
+class MemoryDatabase(object):
+    """ In-memory drop-in for `couchdb.Database`
+
+    Implements the part of the API used by relocation (get, save, update,
+    delete, views, update handlers and revision lookups) for tests and
+    benchmarks. Views and update handlers are evaluated with Python
+    equivalents of design functions (see `design.MAP_FUNCTIONS` and
+    `design.UPDATE_FUNCTIONS`), documents are stored JSON-serialized,
+    so stored and returned documents are never shared.
+    """
+
+    def __init__(self, name='memory', map_functions=None, update_functions=None):
+        self.name = name
+        self.docs = {}
+        self.lock = RLock()
+        self.map_functions = MAP_FUNCTIONS if map_functions is None else map_functions
+        self.update_functions = UPDATE_FUNCTIONS if update_functions is None else update_functions
+        self.resource = MemoryResource(self)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+    def __contains__(self, id):
+        return id in self.docs
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __getitem__(self, id):
+        doc = self.get(id)
+        if doc is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        return doc
+
+    def __setitem__(self, id, content):
+        content['_id'] = id
+        self.save(content)
+
+    def __delitem__(self, id):
+        with self.lock:
+            if id not in self.docs:
+                raise ResourceNotFound(('not_found', 'missing'))
+            del self.docs[id]
+
+    def info(self):
+        return {'db_name': self.name, 'doc_count': len(self.docs)}
+
+    def get(self, id, default=None, **options):
+        with self.lock:
+            if id not in self.docs:
+                return default
+            return Document(json.loads(self.docs[id]['json']))
+
+    def _store(self, doc):
+        doc_id = doc.get('_id') or uuid4().hex
+        stored = self.docs.get(doc_id)
+        if (stored and stored['_rev'] != doc.get('_rev')) or (not stored and doc.get('_rev')):
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        if doc.get('_deleted'):
+            del self.docs[doc_id]
+            return doc_id, doc['_rev']
+        rev = '{}-{}'.format(int(stored['_rev'].split('-')[0]) + 1 if stored else 1, uuid4().hex)
+        data = dict(doc, _id=doc_id, _rev=rev)
+        self.docs[doc_id] = {'_rev': rev, 'json': json.dumps(data)}
+        return doc_id, rev
+
+    def save(self, doc, **options):
+        with self.lock:
+            doc_id, rev = self._store(doc)
+        doc.update({'_id': doc_id, '_rev': rev})
+        return doc_id, rev
+
+    def update(self, documents, **options):
+        results = []
+        with self.lock:
+            for doc in documents:
+                try:
+                    doc_id, rev = self._store(doc)
+                except ResourceConflict, e:
+                    results.append((False, doc.get('_id'), e))
+                else:
+                    doc.update({'_id': doc_id, '_rev': rev})
+                    results.append((True, doc_id, rev))
+        return results
+
+    def delete(self, doc):
+        with self.lock:
+            self._store(dict(doc, _deleted=True))
+
+    def view(self, name, wrapper=None, **options):
+        with self.lock:
+            rows = self._view_rows(name, options)
+        if wrapper is not None:
+            rows = [wrapper(row) for row in rows]
+        return rows
+
+    def _view_rows(self, name, options):
+        if name == '_all_docs':
+            emitted = [
+                (collate(doc_id), doc_id, doc_id, {'rev': doc['_rev']})
+                for doc_id, doc in self.docs.items()
+            ]
+        elif name in self.map_functions:
+            emitted = []
+            for doc_id, stored in self.docs.items():
+                doc = json.loads(stored['json'])
+                for key, value in self.map_functions[name](doc):
+                    emitted.append((collate(key), doc_id, key, value))
+        else:
+            raise ResourceNotFound(('not_found', 'missing_named_view'))
+        emitted.sort(key=lambda row: row[:2])
+        total_rows = len(emitted)
+
+        if 'keys' in options or 'key' in options:
+            keys = options.get('keys', [options.get('key')])
+            rows = []
+            for key in keys:
+                matched = [i for i in emitted if i[0] == collate(key)]
+                if not matched and name == '_all_docs':
+                    rows.append(Row(key=key, error='not_found'))
+                rows.extend([Row(id=i[1], key=i[2], value=i[3]) for i in matched])
+        else:
+            descending = options.get('descending')
+            if descending:
+                emitted.reverse()
+            start = options.get('startkey'), options.get('startkey_docid')
+            end = options.get('endkey'), options.get('endkey_docid')
+            inclusive_end = options.get('inclusive_end', True)
+
+            def after_start(row):
+                if start[0] is None:
+                    return True
+                bound = (collate(start[0]), start[1]) if start[1] else (collate(start[0]),)
+                value = row[:len(bound)]
+                return value <= bound if descending else value >= bound
+
+            def before_end(row):
+                if end[0] is None:
+                    return True
+                bound = (collate(end[0]), end[1]) if end[1] else (collate(end[0]),)
+                value = row[:len(bound)]
+                if not inclusive_end and value == bound:
+                    return False
+                return value >= bound if descending else value <= bound
+
+            rows = [
+                Row(id=i[1], key=i[2], value=i[3])
+                for i in emitted if after_start(i) and before_end(i)
+            ]
+        offset = int(options.get('skip', 0))
+        rows = rows[offset:]
+        if options.get('limit') is not None:
+            rows = rows[:int(options['limit'])]
+        if options.get('include_docs'):
+            for row in rows:
+                if row.id in self.docs:
+                    row['doc'] = json.loads(self.docs[row.id]['json'])
+        return MemoryViewResults(rows, total_rows, offset)
+
+    iterview = Database.__dict__['iterview']
+
+    def update_doc(self, name, docid=None, body=None, headers=None, **options):
+        if name not in self.update_functions:
+            raise ResourceNotFound(('not_found', 'missing update function'))
+        with self.lock:
+            doc = self.get(docid) if docid else None
+            doc, response = self.update_functions[name](deepcopy(doc), body)
+            status = response.get('code', 201 if doc else 200)
+            if status >= 400:
+                error = json.loads(response['body'])
+                raise couch_error(status, (error.get('error'), error.get('reason')))
+            response_headers = {}
+            if doc is not None:
+                _, response_headers['X-Couch-Update-NewRev'] = self._store(doc)
+        return response_headers, StringIO(response.get('body', ''))
+
+
+class MemoryServerResource(object):
+    """ Subset of `couchdb.http.Resource` used with server resource """
+
+    def __init__(self, url):
+        self.url = url
+        self.credentials = None
+
+    def __call__(self, *path):
+        return MemoryServerResource('/'.join((self.url.rstrip('/'),) + path))
+
+
+class MemoryServer(object):
+    """ In-memory drop-in for `couchdb.Server` holding MemoryDatabase
+    instances, so application can be started without CouchDB
+    """
+
+    def __init__(self, url='memory://', session=None, full_commit=True):
+        self.databases = {}
+        self.lock = RLock()
+        self.resource = MemoryServerResource(url)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.resource.url)
+
+    def __contains__(self, name):
+        return name in self.databases
+
+    def __iter__(self):
+        return iter(sorted(self.databases))
+
+    def __len__(self):
+        return len(self.databases)
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            raise ResourceNotFound(('not_found', 'Database does not exist.'))
+        return self.databases[name]
+
+    def __delitem__(self, name):
+        self.delete(name)
+
+    def version(self):
+        return 'memory'
+
+    def create(self, name):
+        with self.lock:
+            if name in self.databases:
+                raise PreconditionFailed(('file_exists', 'The database could not be created, the file already exists.'))
+            self.databases[name] = MemoryDatabase(name)
+            return self.databases[name]
+
+    def delete(self, name):
+        with self.lock:
+            if name not in self.databases:
+                raise ResourceNotFound(('not_found', 'Database does not exist.'))
+            del self.databases[name]
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from time import time
+
+from openprocurement.relocation.core.timing import Histogram
+
+# upper bounds of request duration buckets, seconds
+DURATION_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, float('inf'))
+
+# ownership change rejections by error description
+REJECTION_REASONS = {
+    'Invalid transfer': 'invalid_transfer',
+    'Transfer already used': 'transfer_already_used',
+    'Transfer expired': 'transfer_expired',
+    'Only owner is allowed to generate new credentials.': 'not_owner',
+    'Document update conflict.': 'conflict',
+    'Not Found': 'not_found',
+    'Broker Accreditation level does not permit ownership change': 'accreditation',
+    'Duplicate transfer or location in batch.': 'duplicate',
+    'Location is not supported.': 'unsupported_location',
+}
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join([
+        '{}="{}"'.format(name, unicode(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ])
+
+
+class Metric(object):
+    """ Metric with values per combination of label values """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} requires labels: {}'.format(self.name, ', '.join(self.labelnames)))
+        return tuple([labels[i] for i in self.labelnames])
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield self.name, zip(self.labelnames, key), value
+
+
+class LabeledHistogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super(LabeledHistogram, self).__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = Histogram(self.buckets)
+            self.values[key].observe(value)
+
+    def samples(self):
+        with self.lock:
+            values = sorted([
+                (key, zip(histogram.buckets, histogram.counts), histogram.count, histogram.sum)
+                for key, histogram in self.values.items()
+            ])
+        for key, buckets, count, total in values:
+            labels = zip(self.labelnames, key)
+            for bound, bucket_count in buckets:
+                yield self.name + '_bucket', labels + [('le', format_value(bound))], bucket_count
+            yield self.name + '_count', labels, count
+            yield self.name + '_sum', labels, total
+
+
+class MetricsRegistry(object):
+    """ Metrics of relocation in Prometheus text exposition format """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self.add(LabeledHistogram(name, documentation, labelnames, buckets))
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def render(self):
+        return '\n'.join([self.metrics[i].render() for i in sorted(self.metrics)]) + '\n'
+
+
+def relocation_metrics():
+    """ Registry with metrics of relocation core """
+    metrics = MetricsRegistry()
+    metrics.counter('relocation_transfers_created_total', 'Transfers created.')
+    metrics.counter('relocation_ownership_changes_total', 'Ownership changes by result and rejection reason.',
+                    ('result', 'reason'))
+    metrics.counter('relocation_audit_records_total', 'Ownership audit records by result.', ('result',))
+    metrics.counter('relocation_idempotent_replays_total', 'Responses replayed for retried requests.')
+    metrics.counter('relocation_couchdb_requests_total', 'Transfer storage requests by method.', ('method',))
+    metrics.counter('relocation_couchdb_errors_total', 'Failed transfer storage requests by method and error.',
+                    ('method', 'error'))
+    metrics.counter('relocation_requests_total', 'HTTP requests by route, method and status.',
+                    ('route', 'method', 'status'))
+    metrics.histogram('relocation_request_duration_seconds', 'HTTP request latency by route and method.',
+                      ('route', 'method'))
+    return metrics
+
+
+def count_ownership_change(request, accepted=True, reason=None):
+    """ Count accepted ownership change or rejection with reason (by
+    default from the last error of request)
+    """
+    if accepted:
+        result, reason = 'accepted', ''
+    elif reason is None:
+        description = request.errors[-1]['description'] if request.errors else ''
+        result, reason = 'rejected', REJECTION_REASONS.get(description, 'other')
+    else:
+        result = 'rejected'
+    request.registry.transfer_metrics['relocation_ownership_changes_total'].inc(result=result, reason=reason)
+
+
+def metrics_tween_factory(handler, registry):
+    """ Count requests and observe their latency per matched route """
+    requests = registry.transfer_metrics['relocation_requests_total']
+    durations = registry.transfer_metrics['relocation_request_duration_seconds']
+
+    def metrics_tween(request):
+        start = time()
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_int
+            return response
+        finally:
+            route = request.matched_route.name if getattr(request, 'matched_route', None) else ''
+            durations.observe(time() - start, route=route, method=request.method)
+            requests.inc(route=route, method=request.method, status=status)
+    return metrics_tween
@@ -1,14 +1,63 @@
 # -*- coding: utf-8 -*-
+from itertools import chain
 from uuid import uuid4
 
 from couchdb_schematics.document import SchematicsDocument
 from schematics.types import StringType
 from schematics.types.serializable import serializable
-from schematics.transforms import whitelist
+from schematics.transforms import Role, allow_none, whitelist, wholelist
 from openprocurement.api.models import (
     Model, plain_role, get_now, schematics_default_role, IsoDateTimeType
 )
 
+# compiled serializers by (model class, role)
+SERIALIZERS = {}
+
+
+def compile_serializer(cls, role):
+    """ Build function projecting model instance into primitive dict
+    for role, equivalent to `to_primitive` of schematics
+    :param cls: model class
+    :param role: role name
+    :return: function or None if role or some field can't be compiled
+    """
+    roles = cls._options.roles
+    if role and role not in roles:
+        return  # schematics raises error
+    gottago = roles[role] if role else roles.get('default', wholelist())
+    if not isinstance(gottago, Role) or gottago.function.__name__ not in ('whitelist', 'blacklist', 'wholelist'):
+        return  # filter may depend on values
+    fields = []
+    for name, field in chain(cls._fields.items(), cls._serializables.items()):
+        if gottago(name, None):
+            continue
+        if hasattr(field, 'export_loop'):
+            return  # compound field with own roles
+        fields.append((name, field.serialized_name or name, field.to_primitive, allow_none(cls, field)))
+
+    def serializer(instance):
+        data = {}
+        for name, serialized_name, to_primitive, none_allowed in fields:
+            value = instance[name]
+            if value is not None:
+                value = to_primitive(value)
+            if value is not None or none_allowed:
+                data[serialized_name] = value
+        return data or None
+    return serializer
+
+
+def get_serializer(cls, role):
+    key = (cls, role)
+    if key not in SERIALIZERS:
+        SERIALIZERS[key] = compile_serializer(cls, role)
+    return SERIALIZERS[key]
+
+
+def clear_serializers():
+    """ Drop compiled serializers, e.g. after plugins changed models """
+    SERIALIZERS.clear()
+
 
 class Transfer(SchematicsDocument, Model):
 
@@ -17,7 +66,7 @@ class Transfer(SchematicsDocument, Model):
             'plain': plain_role,
             'default': schematics_default_role,
             'create': whitelist(),
-            'view': whitelist('id', 'doc_id', 'date', 'usedFor'),
+            'view': whitelist('id', 'doc_id', 'date', 'usedFor', 'expiresAt'),
         }
 
     owner = StringType(min_length=1)
@@ -25,11 +74,51 @@ class Transfer(SchematicsDocument, Model):
     transfer_token = StringType(min_length=1, default=lambda: uuid4().hex)
     date = IsoDateTimeType(default=get_now)
     usedFor = StringType(min_length=32)  # object path (e.g. /tenders/{id})
+    expiresAt = IsoDateTimeType()  # unused transfer can't be applied after it
 
     def __repr__(self):
         return '<%s:%r@%r>' % (type(self).__name__, self.id, self.rev)
 
+    def serialize(self, role=None, context=None):
+        serializer = get_serializer(type(self), role) if context is None else None
+        if serializer is None:
+            return super(Transfer, self).serialize(role=role, context=context)
+        return serializer(self)
+
     @serializable(serialized_name='id')
     def doc_id(self):
         """A property that is serialized by schematics exports."""
         return self._id
+
+
+class TransferView(object):
+    """ Read-only transfer built directly from CouchDB document
+
+    Serializes `view` role of Transfer without schematics conversion,
+    so it is cheap to build on the read path.
+    """
+    __slots__ = ('id', 'rev', 'owner', 'date', 'usedFor', 'expiresAt', '__parent__')
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.rev = doc.get('_rev')
+        self.owner = doc.get('owner')
+        self.date = doc.get('date')
+        self.usedFor = doc.get('usedFor')
+        self.expiresAt = doc.get('expiresAt')
+        self.__parent__ = None
+
+    def __repr__(self):
+        return '<%s:%r@%r>' % (type(self).__name__, self.id, self.rev)
+
+    def serialize(self, role='view'):
+        if role != 'view':
+            raise ValueError('{} supports only view role'.format(type(self).__name__))
+        data = {'id': self.id}
+        if self.date is not None:
+            data['date'] = self.date
+        if self.usedFor is not None:
+            data['usedFor'] = self.usedFor
+        if self.expiresAt is not None:
+            data['expiresAt'] = self.expiresAt
+        return data
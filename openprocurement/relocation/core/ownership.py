@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+
+from schematics.exceptions import ModelValidationError
+
+from openprocurement.api.models import get_now
+from openprocurement.api.utils import context_unpack, get_revision_changes
+
+from openprocurement.relocation.core.audit import record_ownership_change
+from openprocurement.relocation.core.limits import write_slot
+from openprocurement.relocation.core.metrics import count_ownership_change, REJECTION_REASONS
+from openprocurement.relocation.core.timing import timed
+from openprocurement.relocation.core.utils import (
+    split_location, normalize_location, find_item, is_expired, update_ownership
+)
+from openprocurement.relocation.core.validation import check_accreditation_level
+
+LOGGER = getLogger(__name__)
+
+
+def add_ownership_resolver(config, collection, resolver):
+    """ Configuration directive registering resolver of objects of
+    top-level collection (e.g. 'tenders') for batch ownership change.
+
+    Resolver is called as `resolver(request, doc)` with document of
+    top-level object and returns OwnershipTarget (or its subclass provided
+    by plugin) for it, or None if the document can't change ownership
+    through the batch API.
+    """
+    resolver = config.maybe_dotted(resolver)
+
+    def register():
+        config.registry.ownership_resolvers[collection] = resolver
+    config.action(('relocation_ownership_resolver', collection), register)
+
+
+class OwnershipTarget(object):
+    """ Top-level object changing ownership through the batch API
+
+    Wraps model instance of the object (e.g. Tender built from its
+    document by plugin). Items are found inside the model by path,
+    credentials are applied with `update_ownership` and the model is
+    validated before it is stored. Plugins override methods for objects
+    with other ownership fields, status rules or serialization.
+    """
+
+    def __init__(self, model, level_name=None):
+        """
+        :param model: model instance of top-level object
+        :param level_name: accreditation level attribute of model class
+            to check (as in `validate_accreditation_level`), None to skip
+        """
+        self.model = model
+        self.level_name = level_name
+
+    def find(self, path):
+        """ Item at path (e.g. ['bids', '<id>'], [] for the object itself) or None """
+        return find_item(self.model, path)
+
+    def check(self, request, item):
+        """ Description of error if ownership of item can't be changed
+        (e.g. in current status of object), otherwise None
+        """
+
+    def owner(self, item):
+        return item.get('owner')
+
+    def transfer_token(self, item):
+        return item.get('transfer_token')
+
+    def apply(self, request, item, transfer):
+        """ Apply credentials of transfer (Transfer instance) to item """
+        update_ownership(item, transfer)
+
+    def revision_data(self):
+        """ Data revision changes are computed from, as in `save_tender` """
+        return self.model.serialize('plain')
+
+    def serialize(self):
+        """ Validate object and return its document to store
+        :raises ModelValidationError:
+        """
+        self.model.validate()
+        return self.model.to_primitive()
+
+
+class OwnershipChange(object):
+    """ Item of batch ownership change """
+
+    def __init__(self, data):
+        # same form as location of single change, so transfers are found by it
+        self.location = normalize_location(data['location'])
+        self.transfer_id = data['id']
+        self.token = data['transfer']
+        self.collection, self.object_id, self.path = split_location(self.location)
+        self.transfer = None
+        # usedFor of transfer before the batch, restored if object is not written
+        self.used_for = None
+        self.previous_owner = None
+        self.status = 200
+        self.errors = []
+
+    def error(self, status, location, name, description):
+        self.status = status
+        self.errors.append({'location': location, 'name': name, 'description': description})
+
+    @property
+    def failed(self):
+        return bool(self.errors)
+
+    def report(self):
+        result = {'location': self.location, 'id': self.transfer_id, 'status': self.status}
+        if self.errors:
+            result['errors'] = self.errors
+        return result
+
+
+def check_changes(request, changes, docs):
+    """ Check accreditation, tokens and transfers of items
+    :return: OwnershipTarget instances by object id
+    """
+    resolvers = request.registry.ownership_resolvers
+    verifier = request.registry.token_verifier
+    targets = {}
+    seen_transfers, seen_locations = set(), set()
+    now = get_now()
+    for change in changes:
+        if change.transfer_id in seen_transfers or change.location in seen_locations:
+            change.error(422, 'body', 'data', 'Duplicate transfer or location in batch.')
+            continue
+        seen_transfers.add(change.transfer_id)
+        seen_locations.add(change.location)
+
+        resolver = resolvers.get(change.collection)
+        if resolver is None:
+            change.error(422, 'body', 'location', 'Location is not supported.')
+            continue
+        if change.object_id not in targets:
+            doc = docs.get(change.object_id)
+            targets[change.object_id] = resolver(request, doc) if doc is not None else None
+        target = targets[change.object_id]
+        item = target.find(change.path) if target is not None else None
+        if item is None:
+            change.error(404, 'body', 'location', 'Not Found')
+            continue
+        if target.level_name:
+            error = check_accreditation_level(request, target.model, target.level_name)
+            if error:
+                change.error(403, 'procurementMethodType', error[0], error[1])
+                continue
+        error = target.check(request, item)
+        if error:
+            change.error(403, 'body', 'location', error)
+            continue
+
+        transfer = docs.get(change.transfer_id)
+        if transfer is None or transfer.get('doc_type') != 'Transfer':
+            change.error(404, 'body', 'id', 'Not Found')
+            continue
+        if not verifier.verify(target.transfer_token(item), change.token):
+            change.error(403, 'body', 'transfer', 'Invalid transfer')
+            continue
+        if transfer.get('usedFor') and transfer['usedFor'] != change.location:
+            change.error(403, 'body', 'transfer', 'Transfer already used')
+            continue
+        if is_expired(transfer, now):
+            change.error(403, 'body', 'transfer', 'Transfer expired')
+            continue
+        change.transfer = transfer
+        change.used_for = transfer.get('usedFor')
+    return targets
+
+
+def write_transfers(request, changes, location):
+    """ Set usedFor of transfers to location of changes (or restore usedFor
+    they had before the batch) with one bulk request, failed changes get errors
+    """
+    now = get_now().isoformat()
+    docs = []
+    for change in changes:
+        doc = dict(change.transfer, date=now)
+        if location:
+            doc['usedFor'] = change.location
+        elif change.used_for:
+            # transfer was already applied to the object before
+            doc['usedFor'] = change.used_for
+        else:
+            doc.pop('usedFor', None)
+        docs.append(doc)
+    saved = request.registry.transfer_storage.update(docs)
+    cache = request.registry.transfer_cache
+    for change, doc, (success, _, rev) in zip(changes, docs, saved):
+        if success:
+            doc['_rev'] = rev
+            change.transfer = doc
+            if cache:
+                cache.set(doc)
+            continue
+        if cache:
+            cache.invalidate(change.transfer_id)
+        if location:
+            change.error(409, 'body', 'transfer', 'Document update conflict.')
+
+
+def write_objects(request, changes, docs, targets):
+    """ Apply credentials of transfers to objects, all items of one
+    object are written with one document update. As with `save_tender`
+    revision with changes is appended and dateModified is updated.
+    """
+    now = get_now().isoformat()
+    by_object = {}
+    for change in changes:
+        by_object.setdefault(change.object_id, []).append(change)
+    updated = []
+    for object_id, object_changes in by_object.items():
+        target = targets[object_id]
+        src = target.revision_data()
+        for change in object_changes:
+            item = target.find(change.path)
+            change.previous_owner = target.owner(item)
+            target.apply(request, item, request.transfer_from_data(change.transfer))
+        try:
+            doc = target.serialize()
+        except ModelValidationError, e:
+            for change in object_changes:
+                for name, description in sorted(e.messages.items()):
+                    change.error(422, 'body', name, description)
+            continue
+        patch = get_revision_changes(target.revision_data(), src)
+        doc.update({'_id': object_id, '_rev': docs[object_id]['_rev'], 'dateModified': now})
+        doc['revisions'] = list(doc.get('revisions') or []) + [{
+            'author': request.authenticated_userid,
+            'changes': patch,
+            'rev': docs[object_id]['_rev'],
+            'date': now,
+        }]
+        updated.append((doc, object_changes))
+    saved = request.registry.transfer_storage.update([i[0] for i in updated])
+    for (doc, object_changes), (success, _, rev) in zip(updated, saved):
+        if not success:
+            for change in object_changes:
+                change.error(409, 'body', 'location', 'Document update conflict.')
+
+
+@timed('change_ownership_batch')
+def change_ownership_batch(request, data):
+    """ Change ownership of several objects
+    :param request:
+    :param data: list of dicts with location, id (of transfer) and transfer (token)
+    :return: list of item reports
+    """
+    changes = [OwnershipChange(i) for i in data]
+    ids = set()
+    for change in changes:
+        ids.update([change.object_id, change.transfer_id])
+    rows = request.registry.transfer_storage.view('_all_docs', keys=sorted(ids), include_docs=True)
+    docs = dict([(row.id, row.doc) for row in rows if row.id and row.doc])
+
+    targets = check_changes(request, changes, docs)
+    # as with single change, transfers are marked as used first, so
+    # half-applied changes can be found by relocation_reconcile
+    accepted = [i for i in changes if not i.failed]
+    if accepted:
+        # one write slot for all bulk writes, so the batch is not
+        # rejected after part of it was written
+        with write_slot(request):
+            write_transfers(request, accepted, location=True)
+            accepted = [i for i in accepted if not i.failed]
+            if accepted:
+                write_objects(request, accepted, docs, targets)
+                released = [i for i in accepted if i.failed]
+                if released:
+                    write_transfers(request, released, location=False)
+
+    for change in changes:
+        if change.failed:
+            description = change.errors[-1]['description']
+            # descriptions of validation errors are lists
+            reason = REJECTION_REASONS.get(description, 'other') if isinstance(description, basestring) else 'other'
+            count_ownership_change(request, accepted=False, reason=reason)
+        else:
+            count_ownership_change(request)
+            record_ownership_change(request, change.transfer_id, change.location,
+                                    change.previous_owner, change.transfer['owner'])
+    LOGGER.info('Changed ownership of {} of {} objects'.format(
+        len([i for i in changes if not i.failed]), len(changes)),
+        extra=context_unpack(request, {'MESSAGE_ID': 'ownership_batch_change'}))
+    return [i.report() for i in changes]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import os
+from couchdb import Server, Session
+from pyramid.paster import get_appsettings, setup_logging
+
+
+def get_settings(config_uri):
+    """ Read application settings and configure logging from paste config
+    :param config_uri: path to .ini file
+    :return: settings dict
+    """
+    setup_logging(config_uri)
+    return get_appsettings(config_uri)
+
+
+def get_server(settings):
+    """ Connect to CouchDB server of application
+    :param settings: application settings
+    :return: couchdb Server
+    """
+    return Server(settings.get('couchdb.url'), session=Session(retry_delays=range(10)))
+
+
+def get_db(settings, db_name=None):
+    """ Connect to application database (or other database on the same server)
+    :param settings: application settings
+    :param db_name: database name, `couchdb.db_name` by default
+    :return: couchdb Database
+    """
+    return get_server(settings)[db_name or os.environ.get('DB_NAME', settings['couchdb.db_name'])]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Move used transfers older than retention period into archive database.
+Archived transfers are still returned by GET /transfers/{id} when
+`relocation.archive.db_name` is set in application settings.
+"""
+from argparse import ArgumentParser
+from datetime import timedelta
+from logging import getLogger
+from time import time
+
+from couchdb.http import ResourceConflict
+from openprocurement.api.models import get_now
+
+from openprocurement.relocation.core.design import transfers_by_date_view
+from openprocurement.relocation.core.scripts import get_settings, get_server, get_db
+
+LOGGER = getLogger(__name__)
+
+
+def move_transfers(db, archive, docs):
+    """ Copy transfers to archive database and delete them from application database
+    :param db: application database
+    :param archive: archive database
+    :param docs: transfers as dicts with revisions
+    :return: number of moved transfers
+    """
+    copies = [dict([(i, j) for i, j in doc.items() if i != '_rev']) for doc in docs]
+    results = archive.update(copies)
+    # conflict means transfer is already archived by previous run
+    stored = [
+        doc for doc, (success, _, error) in zip(docs, results)
+        if success or isinstance(error, ResourceConflict)
+    ]
+    deleted = db.update([{'_id': i['_id'], '_rev': i['_rev'], '_deleted': True} for i in stored])
+    return len([i for i in deleted if i[0]])
+
+
+def archive_transfers(db, archive, before, batch=500, dry_run=False):
+    """ Move used transfers with date before `before` to archive database
+    :param db: application database
+    :param archive: archive database
+    :param before: isoformat date
+    :param batch: number of transfers per bulk request
+    :param dry_run: only count transfers to archive
+    :return: generator of (archived, failed) counts per batch
+    """
+    options = dict(endkey=before, inclusive_end=False, limit=batch + 1, include_docs=True)
+    while True:
+        rows = list(transfers_by_date_view(db, **options))
+        docs = [row.doc for row in rows[:batch] if row.doc.get('usedFor')]
+        if docs and dry_run:
+            yield len(docs), 0
+        elif docs:
+            archived = move_transfers(db, archive, docs)
+            yield archived, len(docs) - archived
+        if len(rows) <= batch:
+            return
+        options.update(startkey=rows[batch].key, startkey_docid=rows[batch].id)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('config', help='application .ini file')
+    parser.add_argument('-r', '--retention', type=int, default=90, help='retention period, days')
+    parser.add_argument('-a', '--archive', help='archive database name, '
+                                                '`relocation.archive.db_name` setting by default')
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='only count transfers to archive')
+    args = parser.parse_args()
+    settings = get_settings(args.config)
+    archive_name = args.archive or settings.get('relocation.archive.db_name')
+    if not archive_name:
+        parser.error('archive database is not configured')
+    server = get_server(settings)
+    db = get_db(settings)
+    archive = server[archive_name] if archive_name in server else server.create(archive_name)
+    before = (get_now() - timedelta(days=args.retention)).isoformat()
+
+    start = time()
+    archived = failed = 0
+    for batch_archived, batch_failed in archive_transfers(db, archive, before, args.batch, args.dry_run):
+        archived += batch_archived
+        failed += batch_failed
+        LOGGER.info('{} {} transfers ({:.1f}/s), failed {}'.format(
+            'Found' if args.dry_run else 'Archived', archived, archived / max(time() - start, 0.001), failed))
+    LOGGER.info('{} {} transfers used before {} in {:.1f} s, failed {}'.format(
+        'Found' if args.dry_run else 'Archived', archived, before, time() - start, failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from base64 import b64encode
+from datetime import datetime
+from time import time
+from uuid import uuid4
+
+from cornice.errors import Errors
+from pyramid.interfaces import IRequestExtensions
+from pyramid.request import Request
+import openprocurement.api
+from openprocurement.api import ROUTE_PREFIX
+from openprocurement.api.design import sync_design
+
+from openprocurement.relocation.core.includeme import PKG
+from openprocurement.relocation.core.memory import MemoryDatabase, MemoryServer
+from openprocurement.relocation.core.utils import change_ownership
+from openprocurement.relocation.core.validation import (
+    validate_transfer_data, validate_ownership_data
+)
+
+
+def percentile(durations, percent):
+    """ Nearest-rank percentile of sorted durations """
+    index = int(round(percent / 100.0 * len(durations) + 0.5)) - 1
+    return durations[max(0, min(index, len(durations) - 1))]
+
+
+def summarize(name, durations):
+    """ Benchmark statistics
+    :param name: scenario name
+    :param durations: list of call durations in seconds
+    :return: dict with throughput (calls/s) and latency percentiles (ms)
+    """
+    durations = sorted(durations)
+    total = sum(durations)
+    return {
+        'name': name,
+        'count': len(durations),
+        'throughput': len(durations) / total if total else 0,
+        'mean': total / len(durations) * 1000,
+        'p50': percentile(durations, 50) * 1000,
+        'p95': percentile(durations, 95) * 1000,
+        'p99': percentile(durations, 99) * 1000,
+    }
+
+
+def measure(func, number, warmup=0):
+    """ Call func(index) number times
+    :return: list of call durations in seconds
+    """
+    for i in xrange(warmup):
+        func(i)
+    durations = []
+    for i in xrange(number):
+        start = time()
+        func(i)
+        durations.append(time() - start)
+    return durations
+
+
+class BenchmarkItem(dict):
+    """ Object (tender/auction) stand-in with ownership fields """
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+class TransferBenchmark(object):
+    """ Hot paths of relocation core on the application from paste config """
+
+    def __init__(self, app, broker='broker'):
+        self.app = app
+        self.registry = app.app.registry
+        self.app.authorization = ('Basic', (broker, ''))
+        self.broker = broker
+        self.transfers = []
+
+    def make_request(self, json_body=None):
+        request = Request.blank('/', headers={
+            'Content-Type': 'application/json',
+            'Authorization': 'Basic ' + b64encode('{}:'.format(self.broker)),
+        })
+        request.registry = self.registry
+        request._set_extensions(self.registry.queryUtility(IRequestExtensions))
+        request.errors = Errors(request)
+        request.validated = {}
+        request.logging_context = {}
+        if json_body is not None:
+            request.body = json.dumps(json_body)
+        return request
+
+    def create(self, index):
+        response = self.app.post_json(ROUTE_PREFIX + '/transfers', {'data': {}})
+        self.transfers.append((response.json['data']['id'], response.json['access']))
+
+    def get(self, index):
+        self.app.get(ROUTE_PREFIX + '/transfers/{}'.format(self.transfers[index % len(self.transfers)][0]))
+
+    def validate(self, index):
+        request = self.make_request({'data': {}})
+        validate_transfer_data(request)
+        request = self.make_request({'data': {'id': uuid4().hex, 'transfer': uuid4().hex}})
+        validate_ownership_data(request)
+
+    def change_ownership(self, index):
+        transfer_id, _ = self.transfers.pop()
+        request = self.make_request()
+        item_transfer = uuid4().hex
+        request.context = BenchmarkItem(owner=self.broker, owner_token='',
+                                        transfer_token=self.registry.token_verifier.hash(item_transfer))
+        request.validated['ownership_data'] = {'id': transfer_id, 'transfer': item_transfer}
+        if not change_ownership(request, '/tenders/{}'.format(uuid4().hex)):
+            raise AssertionError(request.errors)
+
+    def run(self, number, warmup=0):
+        scenarios = [
+            ('create', self.create),
+            ('get', self.get),
+            ('validation', self.validate),
+            ('change_ownership', self.change_ownership),
+        ]
+        results = []
+        for name, func in scenarios:
+            if name == 'change_ownership':
+                # every transfer can be used once
+                self.transfers = []
+                measure(self.create, number + warmup)
+            results.append(summarize(name, measure(func, number, warmup)))
+        return results
+
+
+def compare(results, baseline, threshold):
+    """ Compare p95 latency with baseline results
+    :return: list of (name, ratio) of regressed scenarios
+    """
+    baseline = dict([(i['name'], i) for i in baseline['results']])
+    regressions = []
+    for result in results:
+        if result['name'] not in baseline or not baseline[result['name']]['p95']:
+            continue
+        ratio = result['p95'] / baseline[result['name']]['p95']
+        print '{:<18} p95 {:>8.3f} ms  baseline {:>8.3f} ms  x{:.2f}'.format(
+            result['name'], result['p95'], baseline[result['name']]['p95'], ratio)
+        if ratio > 1 + threshold / 100.0:
+            regressions.append((result['name'], ratio))
+    return regressions
+
+
+def load_app(config, memory=False):
+    """ Application from paste config wrapped with webtest
+    :param config: path of .ini file
+    :param memory: start application with in-memory CouchDB server, so
+        openprocurement.api doesn't connect to server from config
+    """
+    import webtest
+    server = openprocurement.api.Server
+    if memory:
+        openprocurement.api.Server = MemoryServer
+    try:
+        return webtest.TestApp('config:' + os.path.abspath(config))
+    finally:
+        openprocurement.api.Server = server
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of transfer and ownership change hot paths')
+    parser.add_argument('config', help='application .ini file')
+    parser.add_argument('-n', '--number', type=int, default=1000)
+    parser.add_argument('-w', '--warmup', type=int, default=50)
+    parser.add_argument('-b', '--broker', default='broker', help='broker from auth.file')
+    parser.add_argument('-o', '--output', help='save results as JSON')
+    parser.add_argument('-c', '--compare', help='results JSON to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=10,
+                        help='allowed p95 regression, percents')
+    parser.add_argument('-m', '--memory', action='store_true',
+                        help='use in-memory database instead of CouchDB')
+    args = parser.parse_args()
+
+    app = load_app(args.config, args.memory)
+    registry = app.app.registry
+    server, db = registry.couchdb_server, registry.db
+    db_name = 'relocation_benchmark_' + uuid4().hex
+    if args.memory:
+        registry.db = MemoryDatabase(db_name)
+    else:
+        registry.db = server.create(db_name)
+        sync_design(registry.db)
+    try:
+        results = TransferBenchmark(app, args.broker).run(args.number, args.warmup)
+    finally:
+        if not args.memory:
+            server.delete(db_name)
+        registry.db = db
+
+    for result in results:
+        print '{name:<18} {count:>7} calls {throughput:>10.1f}/s  mean {mean:>8.3f} ms  ' \
+              'p50 {p50:>8.3f} ms  p95 {p95:>8.3f} ms  p99 {p99:>8.3f} ms'.format(**result)
+    report = {
+        'version': PKG.version,
+        'date': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'number': args.number,
+        'database': 'memory' if args.memory else 'couchdb',
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit('Regressions: {}'.format(', '.join(['{} x{:.2f}'.format(*i) for i in regressions])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Remove unused transfers which expired (see `relocation.expiry.days`
+setting), or move them into archive database with --archive. Transfers are
+found with `transfers/by_expiresAt` view and removed with bulk requests
+of --batch transfers, at most --rate transfers per second. With --interval
+the sweep is repeated until interrupted.
+"""
+from argparse import ArgumentParser
+from logging import getLogger
+from time import time, sleep
+
+from openprocurement.api.models import get_now
+
+from openprocurement.relocation.core.design import transfers_by_expiresAt_view, timestamp
+from openprocurement.relocation.core.scripts import get_settings, get_server, get_db
+from openprocurement.relocation.core.scripts.archive import move_transfers
+
+LOGGER = getLogger(__name__)
+
+
+def expire_transfers(db, now, batch=500, archive=None, dry_run=False):
+    """ Remove (or move to archive) unused transfers expired at `now`
+    :param db: application database
+    :param now: milliseconds since epoch
+    :param batch: number of transfers per bulk request
+    :param archive: archive database, expired transfers are deleted if None
+    :param dry_run: only count expired transfers
+    :return: generator of (removed, failed) counts per batch
+    """
+    options = dict(endkey=now, limit=batch + 1, include_docs=True)
+    while True:
+        rows = list(transfers_by_expiresAt_view(db, **options))
+        docs = [row.doc for row in rows[:batch] if row.doc]
+        if docs and dry_run:
+            yield len(docs), 0
+        elif docs and archive is not None:
+            moved = move_transfers(db, archive, docs)
+            yield moved, len(docs) - moved
+        elif docs:
+            # conflict means transfer was used (or updated) meanwhile
+            deleted = db.update([{'_id': i['_id'], '_rev': i['_rev'], '_deleted': True} for i in docs])
+            removed = len([i for i in deleted if i[0]])
+            yield removed, len(docs) - removed
+        if len(rows) <= batch:
+            return
+        options.update(startkey=rows[batch].key, startkey_docid=rows[batch].id)
+
+
+def throttle(counts, rate):
+    """ Pass through batch counts sleeping so no more than `rate`
+    transfers per second are processed
+    """
+    start = time()
+    total = 0
+    for removed, failed in counts:
+        yield removed, failed
+        total += removed + failed
+        if rate:
+            delay = total / float(rate) - (time() - start)
+            if delay > 0:
+                sleep(delay)
+
+
+def sweep(db, archive, args):
+    now = get_now()
+    start = time()
+    removed = failed = 0
+    counts = expire_transfers(db, timestamp(now), args.batch, archive, args.dry_run)
+    for batch_removed, batch_failed in throttle(counts, args.rate):
+        removed += batch_removed
+        failed += batch_failed
+        LOGGER.info('{} {} transfers ({:.1f}/s), failed {}'.format(
+            'Found' if args.dry_run else 'Removed', removed, removed / max(time() - start, 0.001), failed))
+    LOGGER.info('{} {} transfers expired before {} in {:.1f} s, failed {}'.format(
+        'Found' if args.dry_run else 'Removed', removed, now.isoformat(), time() - start, failed))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('config', help='application .ini file')
+    parser.add_argument('-a', '--archive', nargs='?', const='', default=None,
+                        help='move transfers to archive database, '
+                             '`relocation.archive.db_name` setting by default')
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=0, help='max transfers per second, unlimited by default')
+    parser.add_argument('--interval', type=float, default=0, help='repeat sweep every INTERVAL seconds')
+    parser.add_argument('--dry-run', action='store_true', help='only count expired transfers')
+    args = parser.parse_args()
+    settings = get_settings(args.config)
+    db = get_db(settings)
+    archive = None
+    if args.archive is not None:
+        archive_name = args.archive or settings.get('relocation.archive.db_name')
+        if not archive_name:
+            parser.error('archive database is not configured')
+        server = get_server(settings)
+        archive = server[archive_name] if archive_name in server else server.create(archive_name)
+
+    while True:
+        sweep(db, archive, args)
+        if not args.interval:
+            break
+        sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Export all transfers as newline-delimited JSON with constant memory usage.
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from logging import getLogger
+
+from openprocurement.relocation.core.design import transfers_by_date_view
+from openprocurement.relocation.core.models import TransferView
+from openprocurement.relocation.core.scripts import get_settings, get_db
+
+LOGGER = getLogger(__name__)
+
+PROJECTIONS = ('view', 'full')
+
+
+def iter_transfers(db, batch=1000):
+    """ Iterate over transfer documents in pages of `batch` documents
+    :param db: database or TransferStorage
+    :param batch: page size
+    :return: generator of transfers as dicts
+    """
+    options = dict(limit=batch + 1, include_docs=True)
+    while True:
+        rows = list(transfers_by_date_view(db, **options))
+        for row in rows[:batch]:
+            yield row.doc
+        if len(rows) <= batch:
+            return
+        options.update(startkey=rows[batch].key, startkey_docid=rows[batch].id)
+
+
+def export_lines(docs, projection='view'):
+    """ Serialize transfers as NDJSON lines
+    :param docs: iterable of transfers as dicts
+    :param projection: `view` role or `full` document
+    :return: generator of lines
+    """
+    for doc in docs:
+        if projection == 'view':
+            doc = TransferView(doc).serialize('view')
+        yield json.dumps(doc, sort_keys=True) + '\n'
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('config', help='application .ini file')
+    parser.add_argument('-o', '--output', help='output file, stdout by default')
+    parser.add_argument('-p', '--projection', choices=PROJECTIONS, default='view')
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+    db = get_db(get_settings(args.config))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    count = 0
+    try:
+        for line in export_lines(iter_transfers(db, args.batch), args.projection):
+            output.write(line)
+            count += 1
+    finally:
+        if args.output:
+            output.close()
+    LOGGER.info('Exported {} transfers'.format(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Find half-applied transfers, i.e. transfers which are marked as used for an
+object, but the object was not stored with new credentials. Such transfers
+are reported and, with --release, reset to unused state. Transfers used less
+than --older-than seconds ago are skipped, as their objects may be still
+being saved.
+"""
+from argparse import ArgumentParser
+from datetime import timedelta
+from itertools import groupby
+from logging import getLogger
+
+from couchdb.http import ResourceConflict, ResourceNotFound
+from openprocurement.api.models import get_now
+
+from openprocurement.relocation.core.design import transfers_by_usedFor_view, timestamp
+from openprocurement.relocation.core.scripts import get_settings, get_db
+from openprocurement.relocation.core.utils import call_use_handler, split_location, find_item
+
+LOGGER = getLogger(__name__)
+
+
+def resolve_location(db, location):
+    """ Find object by its location (e.g. /tenders/{id}/bids/{id})
+    :param db:
+    :param location: object path
+    :return: object as dict or None
+    """
+    path = split_location(location)
+    if path is None:
+        return
+    obj = db.get(path[1])
+    return find_item(obj, path[2]) if obj is not None else None
+
+
+def find_half_applied_transfers(db, batch=100, older_than=600, now=None):
+    """ Iterate over latest transfers of every location which credentials
+    were not applied to the object
+    :param db:
+    :param batch: view page size
+    :param older_than: skip transfers updated less than this number of seconds ago
+    :param now: datetime, current time by default
+    :return: generator of (transfer, object) tuples
+    """
+    # transfer is marked as used before the object is saved, so the object
+    # of recent transfer may be still being changed
+    deadline = timestamp((now or get_now()) - timedelta(seconds=older_than))
+    rows = db.iterview(transfers_by_usedFor_view.design + '/' + transfers_by_usedFor_view.name,
+                       batch, include_docs=True)
+    for location, location_rows in groupby(rows, key=lambda row: row.key[0]):
+        transfer = list(location_rows)[-1].doc
+        if transfer.get('date') and timestamp(transfer['date']) > deadline:
+            continue
+        obj = resolve_location(db, location)
+        if obj is None:
+            continue
+        if obj.get('owner') != transfer.get('owner') or obj.get('transfer_token') != transfer.get('transfer_token'):
+            yield transfer, obj
+
+
+def release_transfer(db, transfer):
+    """ Reset object location of transfer unless it was changed meanwhile
+    :param db:
+    :param transfer: transfer as dict
+    :return: True if OK
+    """
+    try:
+        call_use_handler(db, transfer['_id'], {'usedFor': None, 'rev': transfer['_rev'],
+                                               'date': get_now().isoformat()})
+    except (ResourceConflict, ResourceNotFound):
+        return False
+    return True
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('config', help='application .ini file')
+    parser.add_argument('--release', action='store_true', help='reset half-applied transfers')
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--older-than', type=int, default=600,
+                        help='skip transfers used less than this number of seconds ago')
+    args = parser.parse_args()
+    db = get_db(get_settings(args.config))
+    found = released = 0
+    for transfer, obj in find_half_applied_transfers(db, args.batch, args.older_than):
+        found += 1
+        LOGGER.warning('Half-applied transfer {} for {}'.format(transfer['_id'], transfer['usedFor']))
+        if args.release and release_transfer(db, transfer):
+            released += 1
+            LOGGER.info('Released transfer {}'.format(transfer['_id']))
+    LOGGER.info('Found {} half-applied transfers, released {}'.format(found, released))
+
+
+if __name__ == '__main__':
+    main()
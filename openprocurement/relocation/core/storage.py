@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from threading import BoundedSemaphore
+from time import time
+
+from couchdb import Database, Session
+from couchdb.http import ResourceNotFound
+
+from openprocurement.relocation.core.timing import count_db_call
+
+
+def fetch_view(results):
+    """ Fetch rows of lazy ViewResults """
+    return len(results)
+
+
+class TransferStorage(object):
+    """ Persistence adapter for transfer documents
+
+    Wraps application database (`registry.db`) and implements the subset of
+    couchdb `Database` API used by relocation, so it can be passed to
+    `Transfer.store`, `ViewDefinition` calls, etc.
+
+    If `session` is given, requests are sent through it (own keep-alive
+    connection pool, timeouts and retries) instead of the session of the
+    application database. If `pool_size` is given, number of concurrent
+    requests (and therefore open connections) is limited. With gevent
+    monkey patching (chaussette gevent backend) waiting for both the pool
+    and the sockets is cooperative.
+    """
+
+    def __init__(self, registry, session=None, pool_size=None, archive_name=None):
+        self.registry = registry
+        self.session = session
+        self.pool = BoundedSemaphore(pool_size) if pool_size else None
+        self.databases = {}
+        self.archive_name = archive_name
+        self.archive_db = None
+
+    @classmethod
+    def from_settings(cls, registry, settings):
+        session = None
+        timeout = settings.get('relocation.storage.timeout')
+        retries = settings.get('relocation.storage.retries')
+        if timeout or retries:
+            session = Session(timeout=float(timeout) if timeout else None,
+                              retry_delays=[0.1 * 2 ** i for i in range(int(retries or 0))] or [0])
+        pool_size = settings.get('relocation.storage.pool_size')
+        return cls(registry, session=session, pool_size=int(pool_size) if pool_size else None,
+                   archive_name=settings.get('relocation.archive.db_name'))
+
+    @property
+    def db(self):
+        db = self.registry.db
+        if self.session is None or not isinstance(db, Database):
+            return db
+        # application database may be replaced (e.g. in tests)
+        if db.resource.url not in self.databases:
+            database = Database(db.resource.url, db.name, session=self.session)
+            database.resource.credentials = db.resource.credentials
+            self.databases[db.resource.url] = database
+        return self.databases[db.resource.url]
+
+    @property
+    def archive(self):
+        """ Database of archived transfers (see relocation_archive script)
+        or None if archive is not configured
+        """
+        if self.archive_db is None and self.archive_name:
+            server = self.registry.couchdb_server
+            self.archive_db = Database(server.resource(self.archive_name), self.archive_name)
+        return self.archive_db
+
+    @property
+    def name(self):
+        return self.db.name
+
+    def call(self, func, *args, **kwargs):
+        metrics = self.registry.transfer_metrics
+        method = func.__name__
+        metrics['relocation_couchdb_requests_total'].inc(method=method)
+        start = time()
+        try:
+            if self.pool is None:
+                return func(*args, **kwargs)
+            with self.pool:
+                return func(*args, **kwargs)
+        except Exception, e:
+            metrics['relocation_couchdb_errors_total'].inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            count_db_call(start)
+
+    def get(self, id, default=None, **options):
+        return self.call(self.db.get, id, default, **options)
+
+    def get_archived(self, id, default=None):
+        """ Get document from archive database
+        :param id: document id
+        :return: document or default if not found or archive is not configured
+        """
+        if self.archive is None:
+            return default
+        return self.call(self.archive.get, id, default)
+
+    def save(self, doc, **options):
+        return self.call(self.db.save, doc, **options)
+
+    def update(self, documents, **options):
+        return self.call(self.db.update, documents, **options)
+
+    def view(self, name, wrapper=None, **options):
+        results = self.db.view(name, wrapper, **options)
+        # rows are fetched lazily by ViewResults, so fetch them in the pool
+        self.call(fetch_view, results)
+        return results
+
+    def update_doc(self, name, docid=None, **options):
+        return self.call(self.db.update_doc, name, docid, **options)
+
+    def revision(self, id):
+        """ Get current revision of document with HEAD request
+        :param id: document id
+        :return: revision or None if document not found
+        """
+        try:
+            _, headers, _ = self.call(self.db.resource.head, id)
+        except ResourceNotFound:
+            return
+        return headers.get('ETag', '').strip('"') or None
+
+    def __getitem__(self, id):
+        return self.call(self.db.__getitem__, id)
+
+    def __delitem__(self, id):
+        return self.call(self.db.__delitem__, id)
@@ -5,9 +5,15 @@ import webtest
 from datetime import datetime
 from uuid import uuid4
 
+from mock import patch
+from pyramid.paster import get_appsettings
+from pyramid.settings import asbool
+import openprocurement.api
 from openprocurement.api.design import sync_design
 from openprocurement.api.tests.base import PrefixedRequestClass
 
+from openprocurement.relocation.core.memory import MemoryDatabase, MemoryServer
+
 test_transfer_data = {}
 now = datetime.now()
 
@@ -16,13 +22,24 @@ class BaseWebTest(unittest.TestCase):
     """Base Web Test to test openprocurement.relocation.api.
 
     It setups the database before each test and delete it after.
+    With `relocation.tests.memory_db = true` in tests.ini (default) the
+    application is started with in-memory server and databases, so no
+    CouchDB is needed. Tests run against CouchDB from `couchdb.url` with
+    RELOCATION_TESTS_MEMORY_DB=false environment variable.
     """
     initial_auth = ('Basic', ('broker', ''))
     relative_to = os.path.dirname(__file__)
 
     @classmethod
     def setUpClass(cls):
-        cls.app = webtest.TestApp("config:tests.ini", relative_to=cls.relative_to)
+        settings = get_appsettings(os.path.join(cls.relative_to, 'tests.ini'))
+        cls.memory_db = asbool(os.environ.get('RELOCATION_TESTS_MEMORY_DB',
+                                              settings.get('relocation.tests.memory_db')))
+        if cls.memory_db:
+            with patch.object(openprocurement.api, 'Server', MemoryServer):
+                cls.app = webtest.TestApp("config:tests.ini", relative_to=cls.relative_to)
+        else:
+            cls.app = webtest.TestApp("config:tests.ini", relative_to=cls.relative_to)
         cls.app.RequestClass = PrefixedRequestClass
         cls.couchdb_server = cls.app.app.registry.couchdb_server
         cls.db = cls.app.app.registry.db
@@ -37,13 +54,17 @@ class BaseWebTest(unittest.TestCase):
 
     def setUp(self):
         self.db_name += uuid4().hex
-        self.couchdb_server.create(self.db_name)
-        db = self.couchdb_server[self.db_name]
-        sync_design(db)
+        if self.memory_db:
+            db = MemoryDatabase(self.db_name)
+        else:
+            self.couchdb_server.create(self.db_name)
+            db = self.couchdb_server[self.db_name]
+            sync_design(db)
         self.app.app.registry.db = db
         self.db = self.app.app.registry.db
         self.db_name = self.db.name
         self.app.authorization = self.initial_auth
 
     def tearDown(self):
-        self.couchdb_server.delete(self.db_name)
+        if not self.memory_db:
+            self.couchdb_server.delete(self.db_name)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+import webtest
+from mock import Mock, patch
+
+import openprocurement.api
+from openprocurement.relocation.core.memory import MemoryDatabase, MemoryServer
+from openprocurement.relocation.core.scripts.benchmark import TransferBenchmark, compare, load_app
+from openprocurement.relocation.core.tests.base import BaseWebTest
+
+
+class BenchmarkTest(BaseWebTest):
+
+    def test_smoke(self):
+        registry = self.app.app.registry
+        registry.db = MemoryDatabase(self.db_name)
+        try:
+            # benchmark requests contain route prefix
+            results = TransferBenchmark(webtest.TestApp(self.app.app)).run(3, warmup=1)
+        finally:
+            registry.db = self.db
+        self.assertEqual([i['name'] for i in results], ['create', 'get', 'validation', 'change_ownership'])
+        self.assertEqual([i['count'] for i in results], [3] * 4)
+        self.assertEqual(compare(results, {'results': results}, 10), [])
+
+    def test_load_app_memory(self):
+        server = Mock(side_effect=AssertionError('CouchDB server is used'))
+        with patch.object(openprocurement.api, 'Server', server):
+            app = load_app(os.path.join(self.relative_to, 'tests.ini'), memory=True)
+            self.assertIs(openprocurement.api.Server, server)
+        self.assertIsInstance(app.app.registry.couchdb_server, MemoryServer)
+        results = TransferBenchmark(app).run(1)
+        self.assertEqual([i['count'] for i in results], [1] * 4)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(BenchmarkTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import patch
+from pyramid.interfaces import IRequestExtensions
+from pyramid.request import Request
+
+from openprocurement.relocation.core.cache import TransferCache, LRUCacheBackend
+from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
+from openprocurement.relocation.core.utils import save_transfer, use_transfer
+
+
+class TransferCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TransferCache(LRUCacheBackend(size=2), ttl=60)
+
+    def test_read_through(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set({'_id': 'a', '_rev': '1-a', 'doc_type': 'Transfer'})
+        doc = self.cache.get('a')
+        self.assertEqual(doc['_rev'], '1-a')
+        doc['usedFor'] = '/tenders/a'
+        self.assertNotIn('usedFor', self.cache.get('a'))
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 1})
+
+    def test_revision_aware(self):
+        self.cache.set({'_id': 'a', '_rev': '2-b'})
+        self.cache.set({'_id': 'a', '_rev': '1-a'})
+        self.assertEqual(self.cache.get('a')['_rev'], '2-b')
+        self.cache.set({'_id': 'a', '_rev': '3-c'})
+        self.assertEqual(self.cache.get('a')['_rev'], '3-c')
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_lru_and_ttl(self):
+        self.cache.set({'_id': 'a', '_rev': '1-a'})
+        self.cache.set({'_id': 'b', '_rev': '1-b'})
+        self.cache.get('a')
+        self.cache.set({'_id': 'c', '_rev': '1-c'})
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        with patch('openprocurement.relocation.core.cache.time', return_value=10 ** 10):
+            self.assertIsNone(self.cache.get('a'))
+
+
+class TransferCacheWebTest(BaseWebTest):
+
+    def setUp(self):
+        super(TransferCacheWebTest, self).setUp()
+        self.cache = self.app.app.registry.transfer_cache = TransferCache(LRUCacheBackend(), ttl=60)
+
+    def tearDown(self):
+        self.app.app.registry.transfer_cache = None
+        super(TransferCacheWebTest, self).tearDown()
+
+    def test_read_after_save(self):
+        response = self.app.post_json('/transfers', {"data": test_transfer_data})
+        transfer_id = response.json['data']['id']
+        self.assertEqual(self.cache.get(transfer_id)['_rev'], self.db.get(transfer_id)['_rev'])
+        stale = self.app.get('/transfers/{}'.format(transfer_id)).headers['ETag']
+
+        request = Request.blank('/')
+        request.registry = self.app.app.registry
+        request._set_extensions(request.registry.queryUtility(IRequestExtensions))
+        old_doc = self.db.get(transfer_id)
+        request.validated = {'transfer': request.extract_transfers([transfer_id])[0]}
+        self.assertTrue(save_transfer(request))
+        # reader which fetched document before the write can't cache it again
+        self.cache.set(old_doc)
+        rev = self.db.get(transfer_id)['_rev']
+        self.assertNotEqual(old_doc['_rev'], rev)
+        self.assertEqual(request.get_transfer_revision(transfer_id), rev)
+        response = self.app.get('/transfers/{}'.format(transfer_id))
+        self.assertNotEqual(response.headers['ETag'], stale)
+
+        old_doc = self.db.get(transfer_id)
+        use_transfer(request, transfer_id, '/tenders/' + 'a' * 32)
+        self.cache.set(old_doc)
+        self.assertEqual(request.get_transfer_revision(transfer_id), self.db.get(transfer_id)['_rev'])
+        self.assertEqual(request.extract_transfers([transfer_id])[0].usedFor, '/tenders/' + 'a' * 32)
+
+    def test_write_of_other_process(self):
+        response = self.app.post_json('/transfers', {"data": test_transfer_data})
+        transfer_id = response.json['data']['id']
+        etag = self.app.get('/transfers/{}'.format(transfer_id)).headers['ETag']
+        # document is changed behind the cache (e.g. by other worker)
+        doc = self.db.get(transfer_id)
+        doc['usedFor'] = '/tenders/' + 'a' * 32
+        self.db.save(doc)
+        self.assertNotEqual(self.cache.get(transfer_id)['_rev'], doc['_rev'])
+
+        response = self.app.get('/transfers/{}'.format(transfer_id), headers={'If-None-Match': etag})
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.json['data']['usedFor'], '/tenders/' + 'a' * 32)
+        self.assertEqual(self.cache.get(transfer_id)['_rev'], doc['_rev'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TransferCacheTest))
+    suite.addTest(unittest.makeSuite(TransferCacheWebTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
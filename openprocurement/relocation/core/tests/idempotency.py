@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
+
+
+class IdempotencyTest(BaseWebTest):
+
+    def tearDown(self):
+        self.app.app.registry.idempotency_store.backend.clear()
+        super(IdempotencyTest, self).tearDown()
+
+    def test_create_transfer(self):
+        headers = {'Idempotency-Key': 'create-1'}
+        replays = self.app.app.registry.transfer_metrics['relocation_idempotent_replays_total']
+        replays_before = replays.get()
+        response = self.app.post_json('/transfers', {"data": test_transfer_data}, headers=headers)
+        self.assertEqual(response.status, '201 Created')
+        replayed = self.app.post_json('/transfers', {"data": test_transfer_data}, headers=headers)
+        self.assertEqual(replayed.status, '201 Created')
+        self.assertEqual(replayed.json, response.json)
+        self.assertEqual(replayed.headers['Idempotency-Key'], 'create-1')
+        self.assertEqual(replays.get(), replays_before + 1)
+
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data]}, headers=headers, status=422)
+        self.assertEqual(response.json['errors'][0]['description'], 'Key was used with different request.')
+
+        # keys are scoped by broker
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {"data": test_transfer_data}, headers=headers)
+        self.assertNotEqual(response.json['data']['id'], replayed.json['data']['id'])
+
+        response = self.app.post_json('/transfers', {"data": test_transfer_data})
+        self.assertNotIn('Idempotency-Key', response.headers)
+
+    def test_change_ownership(self):
+        headers = {'Idempotency-Key': 'ownership-1'}
+        data = {'data': [{'location': '/tenders/' + 'a' * 32, 'id': 'a' * 32, 'transfer': 'a'}]}
+        response = self.app.post_json('/relocation/ownership', data, headers=headers, status=422)
+        replayed = self.app.post_json('/relocation/ownership', data, headers=headers, status=422)
+        self.assertEqual(replayed.json, response.json)
+        self.assertEqual(replayed.headers['Idempotency-Key'], 'ownership-1')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(IdempotencyTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
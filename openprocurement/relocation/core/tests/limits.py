@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import patch
+
+from openprocurement.relocation.core.limits import MemoryRateLimitBackend, RateLimiter, WriteSlots
+from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_token_bucket(self):
+        limiter = RateLimiter('create_transfer', MemoryRateLimitBackend(), rate=2, burst=3)
+        with patch('openprocurement.relocation.core.limits.time', return_value=100):
+            self.assertEqual([limiter.consume('broker') for i in range(3)], [0, 0, 0])
+            self.assertEqual(limiter.consume('broker'), 0.5)
+            self.assertEqual(limiter.consume('broker1', cost=3), 0)
+            self.assertEqual(limiter.consume('broker1'), 0.5)
+        with patch('openprocurement.relocation.core.limits.time', return_value=101):
+            self.assertEqual(limiter.consume('broker', cost=2), 0)
+            self.assertEqual(limiter.consume('broker'), 0.5)
+            # full cost is charged, batch larger than burst never fits
+            self.assertEqual(limiter.consume('broker1', cost=4), 1.0)
+
+    def test_write_slots(self):
+        slots = WriteSlots(2, timeout=0.01)
+        self.assertTrue(slots.acquire())
+        self.assertTrue(slots.acquire())
+        self.assertFalse(slots.acquire())
+        slots.release()
+        self.assertTrue(slots.acquire())
+
+
+class RateLimitWebTest(BaseWebTest):
+
+    def setUp(self):
+        super(RateLimitWebTest, self).setUp()
+        backend = MemoryRateLimitBackend()
+        self.app.app.registry.rate_limiters = {
+            'create_transfer': RateLimiter('create_transfer', backend, rate=0.01, burst=2),
+            'change_ownership': RateLimiter('change_ownership', backend, rate=0.01, burst=1),
+        }
+
+    def tearDown(self):
+        self.app.app.registry.rate_limiters = {}
+        self.app.app.registry.transfer_write_slots = None
+        super(RateLimitWebTest, self).tearDown()
+
+    def test_create_transfer(self):
+        self.app.post_json('/transfers', {"data": test_transfer_data}, status=201)
+        self.app.post_json('/transfers', {"data": test_transfer_data}, status=201)
+        response = self.app.post_json('/transfers', {"data": test_transfer_data}, status=429)
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Rate limit exceeded.', u'location': u'body', u'name': u'data'}
+        ])
+        self.assertEqual(response.headers['Retry-After'], '100')
+
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data] * 3}, status=429)
+        self.assertEqual(response.json['errors'][0]['description'],
+                         'Rate limit exceeded, batch must contain at most 2 items.')
+        self.assertNotIn('Retry-After', response.headers)
+        self.app.post_json('/transfers', {"data": [test_transfer_data] * 2}, status=201)
+        self.app.post_json('/transfers', {"data": test_transfer_data}, status=429)
+
+    def test_change_ownership(self):
+        data = {'data': [{'location': '/tenders/' + 'a' * 32, 'id': 'a' * 32, 'transfer': 'a'}]}
+        self.app.post_json('/relocation/ownership', data, status=422)
+        self.app.post_json('/relocation/ownership', data, status=429)
+
+    def test_write_slots(self):
+        self.app.app.registry.transfer_write_slots = WriteSlots(1, timeout=0.01)
+        self.app.app.registry.transfer_write_slots.acquire()
+        response = self.app.post_json('/transfers', {"data": test_transfer_data}, status=503)
+        self.assertEqual(response.json['errors'][0]['description'], 'Too many concurrent writes.')
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.app.app.registry.transfer_write_slots.release()
+        self.app.post_json('/transfers', {"data": test_transfer_data}, status=201)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RateLimiterTest))
+    suite.addTest(unittest.makeSuite(RateLimitWebTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from couchdb.design import ViewDefinition
+from couchdb.http import ResourceConflict, ResourceNotFound, ServerError
+
+from openprocurement.relocation.core.design import (
+    transfers_by_date_view, transfers_by_owner_view, transfers_by_expiresAt_view, timestamp
+)
+from openprocurement.relocation.core.memory import MemoryDatabase
+
+
+class MemoryDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDatabase()
+
+    def test_documents(self):
+        transfer_id, rev = self.db.save({'doc_type': 'Transfer', 'owner': 'broker'})
+        self.assertTrue(rev.startswith('1-'))
+        doc = self.db.get(transfer_id)
+        self.assertEqual(doc['owner'], 'broker')
+        self.assertEqual(self.db.resource.head(transfer_id)[1]['ETag'], '"{}"'.format(rev))
+
+        doc['owner'] = 'broker1'
+        doc['nested'] = {'a': []}
+        self.db.save(doc)
+        self.assertTrue(doc['_rev'].startswith('2-'))
+        doc['nested']['a'].append(1)
+        self.assertEqual(self.db.get(transfer_id)['nested'], {'a': []})
+        self.assertRaises(ResourceConflict, self.db.save, dict(doc, _rev=rev))
+        self.assertRaises(ResourceConflict, self.db.save, {'_id': 'new', '_rev': '1-a'})
+
+        results = self.db.update([{'_id': 'a'}, dict(doc, _rev=rev), dict(doc, _deleted=True)])
+        self.assertEqual([i[0] for i in results], [True, False, True])
+        self.assertIsInstance(results[1][2], ResourceConflict)
+        self.assertNotIn(transfer_id, self.db)
+        del self.db['a']
+        self.assertIsNone(self.db.get('a'))
+        self.assertRaises(ResourceNotFound, self.db.resource.head, 'a')
+
+    def test_views(self):
+        docs = [
+            {'_id': 'a', 'doc_type': 'Transfer', 'owner': 'broker', 'date': '2016-01-02'},
+            {'_id': 'b', 'doc_type': 'Transfer', 'owner': 'broker', 'date': '2016-01-01', 'usedFor': '/tenders/x'},
+            {'_id': 'c', 'doc_type': 'Transfer', 'owner': 'broker1', 'date': '2016-01-01'},
+            {'_id': 'd', 'doc_type': 'Tender', 'owner': 'broker', 'date': '2016-01-01'},
+        ]
+        self.db.update(docs)
+
+        self.assertEqual([i.id for i in transfers_by_date_view(self.db)], ['b', 'c', 'a'])
+        self.assertEqual(transfers_by_date_view(self.db, limit=1)[0].value, {'usedFor': '/tenders/x'})
+        self.assertEqual([i.id for i in transfers_by_date_view(self.db, descending=True)], ['a', 'c', 'b'])
+        self.assertEqual([i.id for i in transfers_by_date_view(self.db, startkey='2016-01-01', startkey_docid='c')],
+                         ['c', 'a'])
+        self.assertEqual([i.id for i in transfers_by_date_view(self.db, startkey='9', descending=True, limit=2)],
+                         ['a', 'c'])
+        self.assertEqual([i.id for i in transfers_by_date_view(self.db, endkey='2016-01-01', inclusive_end=False)],
+                         [])
+        self.assertEqual([i.id for i in transfers_by_owner_view(self.db, startkey=['broker', True, ''],
+                                                                endkey=['broker', True, {}])], ['a'])
+        self.assertEqual([i.id for i in transfers_by_owner_view(self.db, startkey=['broker', True, '9'],
+                                                                endkey=['broker', True], descending=True)], ['a'])
+
+        rows = self.db.view('_all_docs', keys=['c', 'x'], include_docs=True)
+        self.assertEqual(rows[0].doc['owner'], 'broker1')
+        self.assertEqual(rows[1].error, 'not_found')
+        self.assertEqual([i.id for i in self.db.iterview('transfers/by_date', 1)], ['b', 'c', 'a'])
+        self.assertRaises(ResourceNotFound, ViewDefinition('transfers', 'missing', ''), self.db)
+
+    def test_update_handler(self):
+        self.db.save({'_id': 'a', 'doc_type': 'Transfer', 'owner': 'broker'})
+        body = json.dumps({'usedFor': '/tenders/x', 'date': '2016-01-01'})
+        headers, response = self.db.update_doc('transfers/use', 'a', body=body)
+        self.assertEqual(json.loads(response.read())['usedFor'], '/tenders/x')
+        self.assertEqual(self.db.get('a')['_rev'], headers['X-Couch-Update-NewRev'])
+
+        body = json.dumps({'usedFor': '/tenders/y', 'date': '2016-01-01'})
+        with self.assertRaises(ServerError) as context:
+            self.db.update_doc('transfers/use', 'a', body=body)
+        self.assertEqual(context.exception.args[0], (403, ('forbidden', 'Transfer already used')))
+        with self.assertRaises(ResourceNotFound) as context:
+            self.db.update_doc('transfers/use', 'b', body=body)
+        self.assertEqual(context.exception.args[0], ('not_found', 'transfer'))
+        body = json.dumps({'usedFor': None, 'rev': '1-a', 'date': '2016-01-01'})
+        self.assertRaises(ResourceConflict, self.db.update_doc, 'transfers/use', 'a', body=body)
+
+    def test_expiry(self):
+        self.db.save({'_id': 'a', 'doc_type': 'Transfer', 'expiresAt': '2016-01-01T02:00:00.000001+02:00'})
+        self.db.save({'_id': 'b', 'doc_type': 'Transfer', 'expiresAt': '2016-01-01T00:30:00+00:00'})
+        self.db.save({'_id': 'c', 'doc_type': 'Transfer', 'expiresAt': '2016-01-01T00:10:00+00:00',
+                      'usedFor': '/tenders/x'})
+        rows = transfers_by_expiresAt_view(self.db, endkey=timestamp('2016-01-01T00:30:00Z'))
+        self.assertEqual([i.id for i in rows], ['a', 'b'])
+
+        body = json.dumps({'usedFor': '/tenders/y', 'date': '2016-01-01', 'now': timestamp('2016-01-01T00:00:00Z')})
+        with self.assertRaises(ServerError) as context:
+            self.db.update_doc('transfers/use', 'a', body=body)
+        self.assertEqual(context.exception.args[0], (403, ('forbidden', 'Transfer expired')))
+        headers, response = self.db.update_doc('transfers/use', 'b', body=body)
+        self.assertEqual(json.loads(response.read())['usedFor'], '/tenders/y')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(MemoryDatabaseTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
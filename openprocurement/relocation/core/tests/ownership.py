@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+import unittest
+from hashlib import sha512
+from uuid import uuid4
+
+from cornice.errors import Errors
+from pyramid.interfaces import IRequestExtensions
+from pyramid.request import Request
+from pyramid.response import Response
+from schematics.transforms import blacklist
+from schematics.types import BaseType, StringType
+from schematics.types.compound import ListType, ModelType
+from openprocurement.api.models import Model
+
+from openprocurement.relocation.core import audit
+from openprocurement.relocation.core.limits import WriteSlots
+from openprocurement.relocation.core.memory import MemoryDatabase
+from openprocurement.relocation.core.ownership import OwnershipTarget
+from openprocurement.relocation.core.scripts.benchmark import BenchmarkItem
+from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
+from openprocurement.relocation.core.utils import change_ownership
+
+
+class Bid(Model):
+    id = StringType(required=True)
+    owner = StringType()
+    owner_token = StringType()
+    transfer_token = StringType()
+
+
+class Tender(Model):
+    class Options:
+        roles = {'plain': blacklist('revisions', 'dateModified')}
+
+    doc_type = StringType()
+    status = StringType(choices=['active', 'cancelled'], default='active')
+    owner = StringType()
+    owner_token = StringType()
+    transfer_token = StringType()
+    dateModified = StringType()
+    revisions = BaseType()
+    bids = ListType(ModelType(Bid), default=list())
+
+
+class TenderOwnership(OwnershipTarget):
+
+    def check(self, request, item):
+        if self.model.status == 'cancelled':
+            return "Can't change ownership in current (cancelled) tender status"
+
+
+def resolve_tender(request, doc):
+    if doc.get('doc_type') == 'Tender':
+        return TenderOwnership(Tender(doc, strict=False))
+
+
+class CountingWriteSlots(WriteSlots):
+
+    def __init__(self, size, timeout=1.0):
+        super(CountingWriteSlots, self).__init__(size, timeout)
+        self.acquired = self.max_used = 0
+
+    def acquire(self):
+        if not super(CountingWriteSlots, self).acquire():
+            return False
+        self.acquired += 1
+        self.max_used = max(self.max_used, self.used)
+        return True
+
+
+class OwnershipBatchTest(BaseWebTest):
+
+    def setUp(self):
+        super(OwnershipBatchTest, self).setUp()
+        self.app.app.registry.ownership_resolvers['tenders'] = resolve_tender
+        self.tender_id, self.bid_id = uuid4().hex, uuid4().hex
+        self.db.save({'_id': self.tender_id, 'doc_type': 'Tender', 'owner': 'broker',
+                      'transfer_token': sha512('tender').hexdigest(), 'dateModified': '2016-01-01',
+                      'bids': [{'id': self.bid_id, 'owner': 'broker', 'transfer_token': sha512('bid').hexdigest()}]})
+
+    def tearDown(self):
+        del self.app.app.registry.ownership_resolvers['tenders']
+        self.app.app.registry.transfer_write_slots = None
+        super(OwnershipBatchTest, self).tearDown()
+
+    def test_change_ownership(self):
+        response = self.app.post_json('/relocation/ownership', {'data': []}, status=422)
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Batch must contain from 1 to 1000 ownership changes.',
+             u'location': u'body', u'name': u'data'}
+        ])
+        response = self.app.post_json('/relocation/ownership', {'data': [{'location': '/tenders'}]}, status=422)
+        self.assertEqual([i['name'] for i in response.json['errors']],
+                         ['data.0.id', 'data.0.transfer', 'data.0.location'])
+
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 5})
+        transfers = [i['data']['id'] for i in response.json['data']]
+        tender_path = '/tenders/{}'.format(self.tender_id)
+        bid_path = '{}/bids/{}'.format(tender_path, self.bid_id)
+        tender_rev = self.db.get(self.tender_id)['_rev']
+
+        response = self.app.post_json('/relocation/ownership', {'data': [
+            {'location': tender_path, 'id': transfers[0], 'transfer': 'tender'},
+            {'location': bid_path, 'id': transfers[1], 'transfer': 'bid'},
+            {'location': bid_path, 'id': transfers[2], 'transfer': 'bid'},
+            {'location': '/tenders/' + uuid4().hex, 'id': transfers[3], 'transfer': 'tender'},
+            {'location': '/plans/' + uuid4().hex, 'id': transfers[4], 'transfer': 'plan'},
+        ]})
+        self.assertEqual(response.status, '200 OK')
+        results = response.json['data']
+        self.assertEqual([i['status'] for i in results], [200, 200, 422, 404, 422])
+        self.assertEqual([i['errors'][0]['description'] for i in results[2:]], [
+            u'Duplicate transfer or location in batch.', u'Not Found', u'Location is not supported.'
+        ])
+
+        tender = self.db.get(self.tender_id)
+        self.assertNotEqual(tender['dateModified'], '2016-01-01')
+        revision = tender['revisions'][-1]
+        self.assertEqual(revision['author'], 'broker1')
+        self.assertEqual(revision['rev'], tender_rev)
+        self.assertEqual(revision['date'], tender['dateModified'])
+        self.assertIn({u'op': u'replace', u'path': u'/bids/0/owner', u'value': u'broker'}, revision['changes'])
+        for item, transfer_id, location in [(tender, transfers[0], tender_path),
+                                            (tender['bids'][0], transfers[1], bid_path)]:
+            transfer = self.db.get(transfer_id)
+            self.assertEqual(transfer['usedFor'], location)
+            self.assertEqual(item['owner'], 'broker1')
+            self.assertEqual(item['owner_token'], transfer['access_token'])
+            self.assertEqual(item['transfer_token'], transfer['transfer_token'])
+        for transfer_id in transfers[2:]:
+            self.assertNotIn('usedFor', self.db.get(transfer_id))
+
+        # transfer token of the object is changed, used transfer can't be reused
+        response = self.app.post_json('/relocation/ownership', {'data': [
+            {'location': tender_path, 'id': transfers[2], 'transfer': 'tender'},
+            {'location': bid_path, 'id': transfers[0], 'transfer': 'bid'},
+        ]}, status=422)
+        self.assertEqual([i['errors'][0]['description'] for i in response.json['data']], [
+            u'Invalid transfer', u'Invalid transfer'
+        ])
+
+    def test_location_transfers(self):
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 2})
+        transfers = [i['data']['id'] for i in response.json['data']]
+        tender_path = '/tenders/{}'.format(self.tender_id)
+        bid_path = '{}/bids/{}'.format(tender_path, self.bid_id)
+        response = self.app.post_json('/relocation/ownership', {'data': [
+            {'location': tender_path.lstrip('/'), 'id': transfers[0], 'transfer': 'tender'},
+            {'location': bid_path + '/', 'id': transfers[1], 'transfer': 'bid'},
+        ]})
+        self.assertEqual([i['location'] for i in response.json['data']], [tender_path, bid_path])
+
+        for location, transfer_id in [(tender_path, transfers[0]), (bid_path, transfers[1])]:
+            for query in [location, location.lstrip('/'), location + '/']:
+                response = self.app.get('/relocation/location', {'location': query})
+                self.assertEqual([(i['id'], i['usedFor']) for i in response.json['data']], [(transfer_id, location)])
+
+        # transfers are owned by the new owner of objects
+        self.app.authorization = ('Basic', ('broker', ''))
+        response = self.app.get('/relocation/location', {'location': tender_path})
+        self.assertEqual(response.json['data'], [])
+
+    def test_object_conflict(self):
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 2})
+        transfers = [(i['data']['id'], i['access']['transfer']) for i in response.json['data']]
+        tender_path = '/tenders/{}'.format(self.tender_id)
+        bid_path = '{}/bids/{}'.format(tender_path, self.bid_id)
+        self.app.post_json('/relocation/ownership', {'data': [
+            {'location': tender_path, 'id': transfers[0][0], 'transfer': 'tender'},
+        ]})
+
+        def resolve_updated_tender(request, doc):
+            # object is updated concurrently after it was read
+            self.db.save(dict(doc))
+            return resolve_tender(request, doc)
+        self.app.app.registry.ownership_resolvers['tenders'] = resolve_updated_tender
+
+        # transfer applied again to its location and a new one
+        response = self.app.post_json('/relocation/ownership', {'data': [
+            {'location': tender_path, 'id': transfers[0][0], 'transfer': transfers[0][1]},
+            {'location': bid_path, 'id': transfers[1][0], 'transfer': 'bid'},
+        ]}, status=422)
+        self.assertEqual([i['status'] for i in response.json['data']], [409, 409])
+        # credentials of the first transfer are still on the object, it stays used
+        self.assertEqual(self.db.get(transfers[0][0])['usedFor'], tender_path)
+        self.assertEqual(self.db.get(self.tender_id)['owner_token'], self.db.get(transfers[0][0])['access_token'])
+        self.assertNotIn('usedFor', self.db.get(transfers[1][0]))
+
+    def test_object_checks(self):
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 2})
+        transfers = [i['data']['id'] for i in response.json['data']]
+        tender = self.db.get(self.tender_id)
+        tender['status'] = 'cancelled'
+        self.db.save(tender)
+        invalid_id = uuid4().hex
+        self.db.save({'_id': invalid_id, 'doc_type': 'Tender', 'status': 'unknown', 'owner': 'broker',
+                      'transfer_token': sha512('invalid').hexdigest()})
+
+        response = self.app.post_json('/relocation/ownership', {'data': [
+            {'location': '/tenders/' + self.tender_id, 'id': transfers[0], 'transfer': 'tender'},
+            {'location': '/tenders/' + invalid_id, 'id': transfers[1], 'transfer': 'invalid'},
+        ]}, status=422)
+        self.assertEqual([i['errors'] for i in response.json['data']], [
+            [{u'description': u"Can't change ownership in current (cancelled) tender status",
+              u'location': u'body', u'name': u'location'}],
+            [{u'description': [u"Value must be one of ['active', 'cancelled']."],
+              u'location': u'body', u'name': u'status'}],
+        ])
+        # invalid object is not written, its transfer is released
+        self.assertEqual(self.db.get(invalid_id)['owner'], 'broker')
+        for transfer_id in transfers:
+            self.assertNotIn('usedFor', self.db.get(transfer_id))
+
+    def test_write_slots(self):
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 2})
+        transfers = [i['data']['id'] for i in response.json['data']]
+        tender_path = '/tenders/{}'.format(self.tender_id)
+        data = {'data': [
+            {'location': tender_path, 'id': transfers[0], 'transfer': 'tender'},
+            {'location': '{}/bids/{}'.format(tender_path, self.bid_id), 'id': transfers[1], 'transfer': 'bid'},
+        ]}
+        slots = self.app.app.registry.transfer_write_slots = CountingWriteSlots(1, timeout=0.01)
+
+        slots.acquire()
+        response = self.app.post_json('/relocation/ownership', data, status=503)
+        self.assertEqual(response.json['errors'][0]['description'], 'Too many concurrent writes.')
+        self.assertNotIn('usedFor', self.db.get(transfers[0]))
+        slots.release()
+
+        # transfers and objects of batch are written holding one slot
+        slots.acquired = slots.max_used = 0
+        response = self.app.post_json('/relocation/ownership', data)
+        self.assertEqual([i['status'] for i in response.json['data']], [200, 200])
+        self.assertEqual((slots.acquired, slots.max_used, slots.used), (1, 1, 0))
+
+
+class OwnershipAuditTest(OwnershipBatchTest):
+
+    def setUp(self):
+        super(OwnershipAuditTest, self).setUp()
+        registry = self.app.app.registry
+        registry.ownership_audit = audit.OwnershipAuditLog(registry, self.db_name + '_audit', interval=0.01)
+        if self.memory_db:
+            registry.ownership_audit.db = MemoryDatabase(self.db_name + '_audit', audit.MAP_FUNCTIONS)
+
+    def tearDown(self):
+        registry = self.app.app.registry
+        if not self.memory_db:
+            self.couchdb_server.delete(registry.ownership_audit.db_name)
+        registry.ownership_audit = None
+        super(OwnershipAuditTest, self).tearDown()
+
+    def test_change_ownership(self):
+        super(OwnershipAuditTest, self).test_change_ownership()
+        ownership_audit = self.app.app.registry.ownership_audit
+        ownership_audit.flush()
+        rows = audit.changes_by_location_view(ownership_audit.database, include_docs=True)
+        changes = sorted([(i.doc['location'], i.doc['previousOwner'], i.doc['owner']) for i in rows])
+        tender_path = '/tenders/{}'.format(self.tender_id)
+        self.assertEqual(changes, [
+            (tender_path, 'broker', 'broker1'),
+            ('{}/bids/{}'.format(tender_path, self.bid_id), 'broker', 'broker1'),
+        ])
+        rows = audit.changes_by_owner_view(ownership_audit.database, startkey=['broker'], endkey=['broker', {}])
+        self.assertEqual(len(rows), 2)
+
+    def test_change_ownership_single(self):
+        ownership_audit = self.app.app.registry.ownership_audit
+        self.app.authorization = ('Basic', ('broker1', ''))
+        transfers = [self.app.post_json('/transfers', {'data': test_transfer_data}).json['data']['id']
+                     for i in range(2)]
+        location = '/tenders/{}'.format(self.tender_id)
+
+        for transfer_id, status in [(transfers[0], 409), (transfers[1], 200)]:
+            request = Request.blank('/')
+            request.registry = self.app.app.registry
+            request._set_extensions(request.registry.queryUtility(IRequestExtensions))
+            request.errors = Errors(request)
+            request.validated = {'ownership_data': {'id': transfer_id, 'transfer': 'tender'}}
+            request.logging_context = {}
+            request.context = BenchmarkItem(owner='broker', transfer_token=sha512('tender').hexdigest())
+            self.assertTrue(change_ownership(request, location))
+            # change is recorded after the object is saved by plugin view
+            ownership_audit.flush()
+            rows = audit.changes_by_location_view(ownership_audit.database, startkey=[location], endkey=[location, {}])
+            self.assertEqual(len(rows), 0)
+            request._process_response_callbacks(Response(status=status))
+            ownership_audit.flush()
+
+        rows = audit.changes_by_location_view(ownership_audit.database, startkey=[location], endkey=[location, {}],
+                                              include_docs=True)
+        self.assertEqual([(i.doc['transfer'], i.doc['previousOwner'], i.doc['owner']) for i in rows],
+                         [(transfers[1], 'broker', 'broker1')])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(OwnershipBatchTest))
+    suite.addTest(unittest.makeSuite(OwnershipAuditTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from mock import Mock, patch
+from pkg_resources import WorkingSet
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from openprocurement.relocation.core.includeme import load_plugins
+
+configured = []
+
+ENTRY_POINTS = """
+[openprocurement.relocation.core.plugins]
+first = {0}:plugin [missing]
+second = {0}:plugin [missing]
+""".format(__name__)
+
+
+def plugin(config):
+    configured.append(config)
+
+
+class LoadPluginsTest(unittest.TestCase):
+
+    def setUp(self):
+        del configured[:]
+        # installed distribution with requirement of missing project,
+        # it must not be resolved again when plugins are loaded
+        self.path = mkdtemp()
+        egg_info = os.path.join(self.path, 'openprocurement.relocation.testplugin.egg-info')
+        os.mkdir(egg_info)
+        for name, content in (
+            ('PKG-INFO', 'Metadata-Version: 1.0\nName: openprocurement.relocation.testplugin\nVersion: 0.1\n'),
+            ('entry_points.txt', ENTRY_POINTS),
+            ('requires.txt', '[missing]\nopenprocurement.relocation.missing\n'),
+        ):
+            with open(os.path.join(egg_info, name), 'w') as f:
+                f.write(content)
+        self.patcher = patch('openprocurement.relocation.core.includeme.iter_entry_points',
+                             WorkingSet([self.path]).iter_entry_points)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        rmtree(self.path)
+
+    def test_load_all(self):
+        config = Mock()
+        self.assertEqual(sorted(load_plugins(config)), ['first', 'second'])
+        self.assertEqual(configured, [config, config])
+
+    def test_load_selected(self):
+        config = Mock()
+        self.assertEqual(load_plugins(config, ['second']), ['second'])
+        self.assertEqual(configured, [config])
+        self.assertEqual(load_plugins(config, ['other']), [])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(LoadPluginsTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from hashlib import sha512
+from mock import patch
+from threading import current_thread
+from time import sleep
+
+from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
+from openprocurement.relocation.core.tokens import TokenVerifier, TokenPool, benchmark
+
+
+class TokenVerifierTest(unittest.TestCase):
+
+    def test_legacy_sha512(self):
+        verifier = TokenVerifier()
+        self.assertEqual(verifier.hash('token'), sha512('token').hexdigest())
+        self.assertTrue(verifier.verify(sha512('token').hexdigest(), u'token'))
+        self.assertTrue(verifier.verify(unicode(sha512('token').hexdigest()), 'token'))
+        self.assertFalse(verifier.verify(sha512('token').hexdigest(), 'fake'))
+        self.assertFalse(verifier.verify(sha512('').hexdigest(), ''))
+        self.assertFalse(verifier.verify(None, 'token'))
+
+    def test_schemes(self):
+        self.assertRaises(ValueError, TokenVerifier, 'md5')
+        self.assertRaises(ValueError, TokenVerifier, 'hmac-sha512')
+
+        hmac_verifier = TokenVerifier('hmac-sha512', key='secret')
+        stored = hmac_verifier.hash('token')
+        self.assertTrue(stored.startswith('$hmac-sha512$'))
+        self.assertTrue(hmac_verifier.verify(stored, 'token'))
+        self.assertFalse(hmac_verifier.verify(stored, 'fake'))
+        self.assertFalse(TokenVerifier('hmac-sha512', key='other').verify(stored, 'token'))
+
+        pbkdf2_verifier = TokenVerifier('pbkdf2-sha512', key='secret', iterations=10)
+        stored = pbkdf2_verifier.hash('token')
+        self.assertTrue(stored.startswith('$pbkdf2-sha512$10$'))
+        self.assertTrue(pbkdf2_verifier.verify(stored, 'token'))
+
+        # migration: stored hashes of other schemes and iteration counts stay valid
+        verifier = TokenVerifier('pbkdf2-sha512', key='secret', iterations=20)
+        self.assertTrue(verifier.verify(stored, 'token'))
+        self.assertTrue(verifier.verify(hmac_verifier.hash('token'), 'token'))
+        self.assertTrue(verifier.verify(sha512('token').hexdigest(), 'token'))
+        self.assertFalse(verifier.verify('$unknown$token', 'token'))
+        self.assertFalse(verifier.verify('$pbkdf2-sha512$x$token', 'token'))
+
+    def test_benchmark(self):
+        result = benchmark(TokenVerifier(), number=10)
+        self.assertEqual(set(result), set(['hash', 'verify']))
+
+
+class TokenPoolTest(unittest.TestCase):
+
+    def test_pop(self):
+        verifier = TokenVerifier('hmac-sha512', key='secret')
+        for pool in [TokenPool(verifier), TokenPool(verifier, size=10, threads=2)]:
+            access_token, access_hash, transfer_token, transfer_hash = pool.pop()
+            self.assertEqual(access_hash, sha512(access_token).hexdigest())
+            self.assertTrue(verifier.verify(transfer_hash, transfer_token))
+            self.assertNotEqual(pool.pop(), pool.pop())
+
+    def test_fill(self):
+        pool = TokenPool(TokenVerifier(), size=5)
+        self.assertTrue(pool.queue.empty())
+        pool.pop()
+        for i in range(100):
+            if pool.queue.full():
+                break
+            sleep(0.01)
+        self.assertTrue(pool.queue.full())
+        tokens = [pool.pop() for i in range(5)]
+        self.assertEqual(len(set(tokens)), 5)
+
+
+class StopFill(Exception):
+    pass
+
+
+class TokenPoolWebTest(BaseWebTest):
+
+    def setUp(self):
+        super(TokenPoolWebTest, self).setUp()
+        self.token_pool = self.app.app.registry.token_pool
+
+    def tearDown(self):
+        self.app.app.registry.token_pool = self.token_pool
+        super(TokenPoolWebTest, self).tearDown()
+
+    def test_request_during_fill(self):
+        pool = self.app.app.registry.token_pool = TokenPool(TokenVerifier('pbkdf2-sha512', key='secret'), size=5)
+        # fill on this thread instead of background threads
+        pool.pid = os.getpid()
+        pooled, responses = [], []
+
+        def serve_request(seconds):
+            if current_thread().name.startswith('token-pool-'):
+                # fill threads of other pools
+                return sleep(seconds)
+            # switch to request as gevent would do on yield of fill loop
+            if responses:
+                raise StopFill
+            pooled.append(pool.queue.queue[0][0])
+            responses.append(self.app.post_json('/transfers', {"data": test_transfer_data}, status=201))
+
+        with patch('openprocurement.relocation.core.tokens.sleep', side_effect=serve_request):
+            self.assertRaises(StopFill, pool.fill)
+        # request got the first token while the rest of the pool was being generated
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(responses[0].json['access']['token'], pooled[0])
+        self.assertEqual(pool.queue.qsize(), 1)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TokenVerifierTest))
+    suite.addTest(unittest.makeSuite(TokenPoolTest))
+    suite.addTest(unittest.makeSuite(TokenPoolWebTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -1,9 +1,25 @@
 # -*- coding: utf-8 -*-
+import json
 import unittest
 from uuid import uuid4
 from copy import deepcopy
-
-from openprocurement.relocation.core.models import Transfer
+from datetime import timedelta
+
+from pyramid.interfaces import IRequestExtensions
+from pyramid.request import Request
+
+from openprocurement.api import ROUTE_PREFIX
+from openprocurement.api.models import get_now
+from openprocurement.relocation.core.design import timestamp
+from openprocurement.relocation.core.memory import MemoryDatabase
+from openprocurement.relocation.core.models import Transfer, TransferView, get_serializer
+from openprocurement.relocation.core.utils import is_expired
+from openprocurement.relocation.core.scripts.archive import archive_transfers
+from openprocurement.relocation.core.scripts.expire import expire_transfers
+from openprocurement.relocation.core.scripts.export import iter_transfers
+from openprocurement.relocation.core.scripts.reconcile import (
+    find_half_applied_transfers, release_transfer
+)
 from openprocurement.relocation.core.tests.base import BaseWebTest, test_transfer_data
 
 
@@ -32,13 +48,40 @@ class TrensferTest(BaseWebTest):
 
         u.delete_instance(self.db)
 
+    def test_transfer_view(self):
+        u = Transfer({"owner": "broker", "usedFor": "/tenders/" + uuid4().hex})
+        u.store(self.db)
+        fromdb = self.db.get(u.id)
+
+        view = TransferView(fromdb)
+        self.assertEqual(view.rev, u.rev)
+        self.assertEqual(view.serialize("view"), Transfer(fromdb).serialize("view"))
+        self.assertRaises(AttributeError, setattr, view, 'access_token', '1234')
+        self.assertRaises(ValueError, view.serialize, "plain")
+
+    def test_compiled_serializers(self):
+        u = Transfer({"owner": "broker", "usedFor": "/tenders/" + uuid4().hex})
+        u.store(self.db)
+        for role in ["view", "create", "plain", "default", None]:
+            self.assertIsNotNone(get_serializer(Transfer, role))
+            self.assertEqual(u.serialize(role), u.to_primitive(role))
+        self.assertRaises(ValueError, u.serialize, "missing")
+
 
 class TransferResourceTest(BaseWebTest):
     """ /transfers resource test """
 
     def test_get_transfer(self):
-        response = self.app.get('/transfers', status=405)
-        self.assertEqual(response.status, '405 Method Not Allowed')
+        response = self.app.get('/transfers', status=403)
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Only pending transfers of broker can be listed.', u'location': u'url',
+             u'name': u'mode'}
+        ])
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/transfers')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.json['data'], [])
+        self.app.authorization = self.initial_auth
 
         response = self.app.post_json('/transfers', {'data': test_transfer_data})
         self.assertEqual(response.status, '201 Created')
@@ -60,6 +103,151 @@ class TransferResourceTest(BaseWebTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertIn('{\n    "data": {\n        "', response.body)
 
+    def test_listing(self):
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 3})
+        self.assertEqual(response.status, '201 Created')
+        transfers = [i['data'] for i in response.json['data']]
+        for i in range(2):
+            response = self.app.post_json('/transfers', {'data': test_transfer_data})
+            self.assertEqual(response.status, '201 Created')
+            transfers.append(response.json['data'])
+        transfers = sorted(transfers, key=lambda i: (i['date'], i['id']))
+
+        # all transfers are listed for admins
+        self.app.get('/transfers', status=403)
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/transfers')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(len(response.json['data']), 5)
+        self.assertEqual(set(response.json['data'][0]), set([u'id', u'date']))
+        self.assertEqual([i['id'] for i in response.json['data']], [i['id'] for i in transfers])
+        self.assertNotIn('prev_page', response.json)
+
+        ids = []
+        response = self.app.get('/transfers?limit=2')
+        while response.json['data']:
+            self.assertLessEqual(len(response.json['data']), 2)
+            ids.extend([i['id'] for i in response.json['data']])
+            response = self.app.get(response.json['next_page']['path'].replace(ROUTE_PREFIX, ''))
+            self.assertIn('prev_page', response.json)
+        self.assertEqual(ids, [i['id'] for i in transfers])
+
+        response = self.app.get('/transfers?descending=1&limit=3')
+        self.assertEqual([i['id'] for i in response.json['data']], [i['id'] for i in transfers[::-1][:3]])
+        response = self.app.get(response.json['next_page']['path'].replace(ROUTE_PREFIX, ''))
+        self.assertEqual([i['id'] for i in response.json['data']], [i['id'] for i in transfers[::-1][3:]])
+
+        transfer_doc = self.db.get(transfers[0]['id'])
+        transfer_doc['usedFor'] = '/tenders/' + '1234' * 8
+        self.db.save(transfer_doc)
+        response = self.app.get('/transfers?opt_fields=usedFor,owner')
+        self.assertEqual(response.json['data'][0]['usedFor'], transfer_doc['usedFor'])
+        self.assertNotIn('owner', response.json['data'][0])
+        self.assertNotIn('usedFor', response.json['data'][1])
+        self.assertIn('opt_fields=usedFor%2Cowner', response.json['next_page']['uri'])
+
+    def test_pending_listing(self):
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 3})
+        self.assertEqual(response.status, '201 Created')
+        transfers = sorted([i['data'] for i in response.json['data']], key=lambda i: i['id'])
+
+        self.app.authorization = ('Basic', ('broker1', ''))
+        response = self.app.post_json('/transfers', {'data': test_transfer_data})
+        self.assertEqual(response.status, '201 Created')
+        transfer = response.json['data']
+        response = self.app.get('/transfers?mode=pending')
+        self.assertEqual(response.json['data'], [transfer])
+
+        self.app.authorization = self.initial_auth
+        transfer_doc = self.db.get(transfers[0]['id'])
+        transfer_doc['usedFor'] = '/tenders/' + '1234' * 8
+        self.db.save(transfer_doc)
+
+        response = self.app.get('/transfers?mode=pending&limit=1')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual([i['id'] for i in response.json['data']], [transfers[1]['id']])
+        self.assertIn('mode=pending', response.json['next_page']['uri'])
+        response = self.app.get(response.json['next_page']['path'].replace(ROUTE_PREFIX, ''))
+        self.assertEqual([i['id'] for i in response.json['data']], [transfers[2]['id']])
+        response = self.app.get(response.json['next_page']['path'].replace(ROUTE_PREFIX, ''))
+        self.assertEqual(response.json['data'], [])
+
+        response = self.app.get('/transfers?mode=pending&descending=1')
+        self.assertEqual([i['id'] for i in response.json['data']], [transfers[2]['id'], transfers[1]['id']])
+
+    def test_get_transfer_etag(self):
+        response = self.app.post_json('/transfers', {'data': test_transfer_data})
+        self.assertEqual(response.status, '201 Created')
+        transfer = response.json['data']
+
+        response = self.app.get('/transfers/{}'.format(transfer['id']))
+        self.assertEqual(response.status, '200 OK')
+        etag = response.headers['ETag']
+        self.assertEqual(etag, '"{}"'.format(self.db.get(transfer['id'])['_rev']))
+
+        response = self.app.get('/transfers/{}'.format(transfer['id']),
+                                headers={'If-None-Match': etag}, status=304)
+        self.assertEqual(response.status, '304 Not Modified')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.body, '')
+
+        transfer_doc = self.db.get(transfer['id'])
+        transfer_doc['usedFor'] = '/tenders/' + '1234' * 8
+        self.db.save(transfer_doc)
+        response = self.app.get('/transfers/{}'.format(transfer['id']),
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status, '200 OK')
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.json['data']['usedFor'], transfer_doc['usedFor'])
+
+        response = self.app.get('/transfers/{}'.format('1234' * 8),
+                                headers={'If-None-Match': etag}, status=404)
+        self.assertEqual(response.status, '404 Not Found')
+
+        # revision of other documents doesn't match transfer
+        tender_id = uuid4().hex
+        self.db.save({'_id': tender_id, 'doc_type': 'Tender'})
+        tender_etag = '"{}"'.format(self.db.get(tender_id)['_rev'])
+        self.app.get('/transfers/{}'.format(tender_id), headers={'If-None-Match': tender_etag}, status=404)
+
+    def test_extract_transfers(self):
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data] * 3})
+        ids = [i['data']['id'] for i in response.json['data']]
+        self.db.save({'_id': 'tender', 'doc_type': 'Tender'})
+
+        request = Request.blank('/')
+        request.registry = self.app.app.registry
+        request._set_extensions(request.registry.queryUtility(IRequestExtensions))
+        transfers = request.extract_transfers([ids[2], 'tender', 'missing', ids[0], ids[2]], batch_size=2)
+        self.assertEqual([i and i.id for i in transfers], [ids[2], None, None, ids[0], ids[2]])
+        self.assertIsInstance(transfers[0], Transfer)
+
+    def test_location_transfers(self):
+        location = '/tenders/' + uuid4().hex
+        ids = []
+        for broker in ['broker', 'broker1', 'broker']:
+            self.app.authorization = ('Basic', (broker, ''))
+            response = self.app.post_json('/transfers', {"data": test_transfer_data})
+            ids.append(response.json['data']['id'])
+            transfer_doc = self.db.get(ids[-1])
+            transfer_doc['usedFor'] = location
+            self.db.save(transfer_doc)
+        response = self.app.post_json('/transfers', {"data": test_transfer_data})
+
+        response = self.app.get('/relocation/location', {'location': location})
+        self.assertEqual([i['id'] for i in response.json['data']], [ids[0], ids[2]])
+        self.assertEqual(response.json['data'][0]['usedFor'], location)
+        response = self.app.get('/relocation/location', {'location': location + '/bids'}, status=422)
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Invalid location.', u'location': u'url', u'name': u'location'}
+        ])
+
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/relocation/location', {'location': location})
+        self.assertEqual([i['id'] for i in response.json['data']], ids)
+        response = self.app.get('/relocation/location', {'location': '/tenders/' + uuid4().hex})
+        self.assertEqual(response.json['data'], [])
+
     def test_not_found(self):
         response = self.app.post_json('/transfers', {'data': test_transfer_data})
         self.assertEqual(response.status, '201 Created')
@@ -132,11 +320,233 @@ class TransferResourceTest(BaseWebTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertIn('{\n    "', response.body)
 
+    def test_create_transfers(self):
+        response = self.app.post_json('/transfers', {"data": []}, status=422)
+        self.assertEqual(response.status, '422 Unprocessable Entity')
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Batch must contain from 1 to 1000 transfers.', u'location': u'body', u'name': u'data'}
+        ])
+
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data, "invalid", test_transfer_data]})
+        self.assertEqual(response.status, '201 Created')
+        results = response.json['data']
+        self.assertEqual([i['status'] for i in results], [201, 422, 201])
+        self.assertEqual(results[1]['errors'], [
+            {u'description': u'Data not available', u'location': u'body', u'name': u'data'}
+        ])
+        self.assertNotEqual(results[0]['data']['id'], results[2]['data']['id'])
+        self.assertNotEqual(results[0]['access'], results[2]['access'])
+
+        for result in [results[0], results[2]]:
+            self.assertIn('token', result['access'])
+            self.assertIn('transfer', result['access'])
+            response = self.app.get('/transfers/{}'.format(result['data']['id']))
+            self.assertEqual(response.status, '200 OK')
+            self.assertEqual(response.json['data'], result['data'])
+
+        response = self.app.post_json('/transfers', {"data": ["invalid"]}, status=422)
+        self.assertEqual(response.status, '422 Unprocessable Entity')
+        self.assertEqual([i['status'] for i in response.json['data']], [422])
+
+
+class TransferReconcileTest(BaseWebTest):
+
+    def test_half_applied_transfers(self):
+        tender_id = uuid4().hex
+        self.db.save({'_id': tender_id, 'doc_type': 'Tender', 'owner': 'broker', 'transfer_token': 'old',
+                      'bids': [{'id': 'b' * 32, 'owner': 'broker', 'transfer_token': 'old'}]})
+        response = self.app.post_json('/transfers', {'data': [test_transfer_data] * 3})
+        transfers = [i['data'] for i in response.json['data']]
+        for transfer, location in zip(transfers, ['/tenders/' + tender_id,
+                                                  '/tenders/{}/bids/{}'.format(tender_id, 'b' * 32),
+                                                  '/tenders/' + uuid4().hex]):
+            transfer_doc = self.db.get(transfer['id'])
+            transfer_doc['usedFor'] = location
+            self.db.save(transfer_doc)
+
+        # changes may be in progress, objects are not saved yet
+        self.assertEqual(list(find_half_applied_transfers(self.db)), [])
+        found = list(find_half_applied_transfers(self.db, batch=1, older_than=0))
+        self.assertEqual(sorted([i['_id'] for i, _ in found]), sorted([i['id'] for i in transfers[:2]]))
+        later = get_now() + timedelta(minutes=11)
+        found = list(find_half_applied_transfers(self.db, now=later))
+        self.assertEqual(len(found), 2)
+
+        # credentials of bid transfer are applied
+        bid_transfer = self.db.get(transfers[1]['id'])
+        tender = self.db.get(tender_id)
+        tender['bids'][0].update(owner=bid_transfer['owner'], transfer_token=bid_transfer['transfer_token'])
+        self.db.save(tender)
+        found = list(find_half_applied_transfers(self.db, older_than=0))
+        self.assertEqual([i['_id'] for i, _ in found], [transfers[0]['id']])
+
+        transfer_doc = found[0][0]
+        self.assertTrue(release_transfer(self.db, transfer_doc))
+        self.assertFalse(release_transfer(self.db, transfer_doc))
+        self.assertNotIn('usedFor', self.db.get(transfers[0]['id']))
+        self.assertEqual(list(find_half_applied_transfers(self.db, older_than=0)), [])
+
+
+class TransferTimingsTest(BaseWebTest):
+
+    def test_timings(self):
+        self.app.app.registry.transfer_timings.clear()
+        response = self.app.post_json('/transfers', {"data": test_transfer_data})
+        self.app.get('/transfers/{}'.format(response.json['data']['id']))
+
+        response = self.app.get('/relocation/timings', status=403)
+        self.assertEqual(response.status, '403 Forbidden')
+
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/relocation/timings')
+        self.assertEqual(response.status, '200 OK')
+        timings = response.json['data']
+        for stage in ['request', 'couchdb', 'validate_transfer_data', 'set_ownership',
+                      'save_transfer', 'extract_transfer_view']:
+            self.assertIn(stage, timings)
+        self.assertEqual(timings['request']['count'], 2)
+        self.assertEqual(timings['request']['buckets'][-1], ['+Inf', 2])
+
+        response = self.app.delete('/relocation/timings')
+        self.assertEqual(response.json['data'], {})
+        response = self.app.get('/relocation/timings')
+        self.assertEqual(response.json['data'], {})
+
+
+class TransferMetricsTest(BaseWebTest):
+
+    def test_metrics(self):
+        metrics = self.app.app.registry.transfer_metrics
+        created = metrics['relocation_transfers_created_total'].get()
+        self.app.post_json('/transfers', {"data": test_transfer_data})
+        self.app.post_json('/transfers', {"data": [test_transfer_data, "invalid"]})
+        self.assertEqual(metrics['relocation_transfers_created_total'].get(), created + 2)
+
+        response = self.app.get('/relocation/metrics', status=403)
+        self.assertEqual(response.status, '403 Forbidden')
+
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/relocation/metrics')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.content_type, 'text/plain')
+        self.assertIn('# TYPE relocation_transfers_created_total counter', response.text)
+        self.assertIn('relocation_transfers_created_total {}'.format(float(created + 2)), response.text)
+        self.assertIn('relocation_requests_total{route="collection_Transfers",method="POST",status="201"}',
+                      response.text)
+        self.assertIn('relocation_request_duration_seconds_bucket{route="collection_Transfers",method="POST",'
+                      'le="+Inf"}', response.text)
+        self.assertIn('relocation_couchdb_requests_total{method="update"}', response.text)
+
+
+class TransferExportTest(BaseWebTest):
+
+    def test_export(self):
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data] * 3})
+        transfers = [i['data'] for i in response.json['data']]
+
+        response = self.app.get('/relocation/export', status=403)
+        self.assertEqual(response.status, '403 Forbidden')
+
+        self.app.authorization = ('Basic', ('test', ''))
+        response = self.app.get('/relocation/export')
+        self.assertEqual(response.status, '200 OK')
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        lines = [json.loads(i) for i in response.body.splitlines()]
+        self.assertEqual(sorted(lines), sorted(transfers))
+
+        response = self.app.get('/relocation/export?projection=full')
+        lines = [json.loads(i) for i in response.body.splitlines()]
+        self.assertEqual(sorted([i['_id'] for i in lines]), sorted([i['id'] for i in transfers]))
+        self.assertIn('transfer_token', lines[0])
+
+        docs = list(iter_transfers(self.db, batch=2))
+        self.assertEqual(sorted([i['_id'] for i in docs]), sorted([i['id'] for i in transfers]))
+
+        response = self.app.get('/relocation/export?projection=plain', status=422)
+        self.assertEqual(response.json['errors'][0]['name'], 'projection')
+
+
+class TransferArchiveTest(BaseWebTest):
+
+    def setUp(self):
+        super(TransferArchiveTest, self).setUp()
+        self.archive_name = self.db_name + '_archive'
+        if self.memory_db:
+            self.archive = MemoryDatabase(self.archive_name)
+        else:
+            self.archive = self.couchdb_server.create(self.archive_name)
+        self.app.app.registry.transfer_storage.archive_db = self.archive
+
+    def tearDown(self):
+        self.app.app.registry.transfer_storage.archive_db = None
+        if not self.memory_db:
+            self.couchdb_server.delete(self.archive_name)
+        super(TransferArchiveTest, self).tearDown()
+
+    def test_archive(self):
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data] * 3})
+        transfers = [i['data'] for i in response.json['data']]
+        for transfer in transfers[:2]:
+            transfer_doc = self.db.get(transfer['id'])
+            transfer_doc['usedFor'] = '/tenders/' + uuid4().hex
+            self.db.save(transfer_doc)
+
+        self.assertEqual(list(archive_transfers(self.db, self.archive, transfers[0]['date'], dry_run=True)), [])
+        results = list(archive_transfers(self.db, self.archive, '9999', batch=1))
+        self.assertEqual(sum([i[0] for i in results]), 2)
+        self.assertEqual(sum([i[1] for i in results]), 0)
+        self.assertIsNone(self.db.get(transfers[0]['id']))
+        self.assertIsNotNone(self.db.get(transfers[2]['id']))
+
+        response = self.app.get('/transfers/{}'.format(transfers[0]['id']))
+        self.assertEqual(response.status, '200 OK')
+        self.assertIn('usedFor', response.json['data'])
+
+        self.app.app.registry.transfer_storage.archive_db = None
+        self.app.get('/transfers/{}'.format(transfers[0]['id']), status=404)
+
+
+class TransferExpiryTest(BaseWebTest):
+
+    def setUp(self):
+        super(TransferExpiryTest, self).setUp()
+        self.app.app.registry.transfer_ttl = timedelta(days=1)
+
+    def tearDown(self):
+        self.app.app.registry.transfer_ttl = None
+        super(TransferExpiryTest, self).tearDown()
+
+    def test_expiry(self):
+        response = self.app.post_json('/transfers', {"data": [test_transfer_data] * 3})
+        transfers = [i['data'] for i in response.json['data']]
+        self.assertIn('expiresAt', transfers[0])
+        self.assertFalse(is_expired(transfers[0]))
+        response = self.app.get('/transfers/{}'.format(transfers[0]['id']))
+        self.assertEqual(response.json['data']['expiresAt'], transfers[0]['expiresAt'])
+
+        transfer_doc = self.db.get(transfers[1]['id'])
+        transfer_doc['usedFor'] = '/tenders/' + uuid4().hex
+        self.db.save(transfer_doc)
+        expires = [timestamp(i['expiresAt']) for i in transfers]
+        self.assertEqual(list(expire_transfers(self.db, min(expires) - 1)), [])
+        results = list(expire_transfers(self.db, max(expires), batch=1))
+        self.assertEqual(sum([i[0] for i in results]), 2)
+        self.assertEqual(sum([i[1] for i in results]), 0)
+        self.assertIsNone(self.db.get(transfers[0]['id']))
+        self.assertIsNotNone(self.db.get(transfers[1]['id']))
+        self.assertIsNone(self.db.get(transfers[2]['id']))
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TrensferTest))
     suite.addTest(unittest.makeSuite(TransferResourceTest))
+    suite.addTest(unittest.makeSuite(TransferReconcileTest))
+    suite.addTest(unittest.makeSuite(TransferTimingsTest))
+    suite.addTest(unittest.makeSuite(TransferMetricsTest))
+    suite.addTest(unittest.makeSuite(TransferExportTest))
+    suite.addTest(unittest.makeSuite(TransferArchiveTest))
+    suite.addTest(unittest.makeSuite(TransferExpiryTest))
     return suite
 
 
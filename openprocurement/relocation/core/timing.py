@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from functools import wraps
+from logging import getLogger
+from threading import Lock, local
+from time import time
+
+from openprocurement.api.utils import context_unpack
+
+LOGGER = getLogger(__name__)
+
+# upper bounds of histogram buckets, milliseconds
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+# timings of request being processed by the current thread (greenlet when
+# gevent monkey patching is used)
+_current = local()
+
+
+class Histogram(object):
+    """ Cumulative histogram of durations in milliseconds """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def report(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0,
+            'buckets': [
+                ['+Inf' if bound == float('inf') else bound, count]
+                for bound, count in zip(self.buckets, self.counts)
+            ],
+        }
+
+
+class TimingStats(object):
+    """ Process-wide histograms of stage durations """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = Lock()
+
+    def observe(self, stage, value):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(value)
+
+    def report(self):
+        with self.lock:
+            return dict([(stage, histogram.report()) for stage, histogram in self.histograms.items()])
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+class RequestTimings(object):
+    """ Stage durations and CouchDB calls of one request """
+
+    def __init__(self):
+        self.stages = {}
+        self.db_calls = 0
+        self.db_time = 0.0
+
+    def add(self, stage, duration):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def add_db_call(self, duration):
+        self.db_calls += 1
+        self.db_time += duration
+
+
+def current_timings():
+    return getattr(_current, 'timings', None)
+
+
+def timed(stage):
+    """ Decorator recording duration of function call as request stage.
+    Durations are inclusive, e.g. `change_ownership` includes `use_transfer`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current_timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(stage, time() - start)
+        return wrapper
+    return decorator
+
+
+def count_db_call(start):
+    """ Record CouchDB call started at `start` """
+    timings = current_timings()
+    if timings is not None:
+        timings.add_db_call(time() - start)
+
+
+def timing_tween_factory(handler, registry):
+    """ Collect stage timings of request, log them with request context
+    and add them to `registry.transfer_timings` histograms.
+    """
+    stats = registry.transfer_timings
+
+    def timing_tween(request):
+        timings = _current.timings = RequestTimings()
+        start = time()
+        try:
+            return handler(request)
+        finally:
+            _current.timings = None
+            if timings.stages or timings.db_calls:
+                duration = (time() - start) * 1000
+                stats.observe('request', duration)
+                stats.observe('couchdb', timings.db_time * 1000)
+                params = {'timing_request': '{:.3f}'.format(duration),
+                          'timing_couchdb': '{:.3f}'.format(timings.db_time * 1000),
+                          'couchdb_calls': timings.db_calls}
+                for stage, duration in timings.stages.items():
+                    stats.observe(stage, duration * 1000)
+                    params['timing_' + stage] = '{:.3f}'.format(duration * 1000)
+                LOGGER.info('Request timings',
+                            extra=context_unpack(request, {'MESSAGE_ID': 'relocation_timings'}, params))
+    return timing_tween
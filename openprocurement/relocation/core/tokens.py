@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import hmac
+import os
+from argparse import ArgumentParser
+from hashlib import sha512, pbkdf2_hmac
+from Queue import Queue, Empty
+from threading import Lock, Thread
+from time import sleep
+from timeit import timeit
+from uuid import uuid4
+
+from openprocurement.relocation.core.timing import timed
+
+
+def to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class SHA512Hasher(object):
+    """ Plain sha512 hex digest without prefix
+
+    This is the scheme used by openprocurement.api for `owner_token`,
+    `transfer_token` and `tender_token`, so hashes without prefix are
+    always verified with it.
+    """
+    scheme = 'sha512'
+
+    def encode(self, token):
+        return sha512(token).hexdigest()
+
+    def parse(self, stored):
+        return self
+
+
+class HMACSHA512Hasher(object):
+    """ Keyed sha512: $hmac-sha512$<hexdigest> """
+    scheme = 'hmac-sha512'
+
+    def __init__(self, key):
+        self.key = to_bytes(key)
+
+    def encode(self, token):
+        return '${}${}'.format(self.scheme, hmac.new(self.key, token, sha512).hexdigest())
+
+    def parse(self, stored):
+        return self
+
+
+class PBKDF2Hasher(object):
+    """ Iterated keyed sha512: $pbkdf2-sha512$<iterations>$<hexdigest> """
+    scheme = 'pbkdf2-sha512'
+
+    def __init__(self, key, iterations=1000):
+        self.key = to_bytes(key)
+        self.iterations = iterations
+
+    def encode(self, token):
+        digest = pbkdf2_hmac('sha512', token, self.key, self.iterations).encode('hex')
+        return '${}${}${}'.format(self.scheme, self.iterations, digest)
+
+    def parse(self, stored):
+        # stored hash keeps its iteration count, so the count can be
+        # changed without invalidating existing tokens
+        iterations = stored.split('$')[2]
+        if not iterations.isdigit():
+            return
+        if int(iterations) == self.iterations:
+            return self
+        return PBKDF2Hasher(self.key, int(iterations))
+
+
+class TokenVerifier(object):
+    """ Hash tokens with configured scheme and verify them against stored
+    hashes of any known scheme in constant time.
+    """
+
+    def __init__(self, scheme='sha512', key='', iterations=1000):
+        self.hashers = {
+            SHA512Hasher.scheme: SHA512Hasher(),
+            HMACSHA512Hasher.scheme: HMACSHA512Hasher(key),
+            PBKDF2Hasher.scheme: PBKDF2Hasher(key, iterations),
+        }
+        if scheme not in self.hashers:
+            raise ValueError('Unknown token hashing scheme: {}'.format(scheme))
+        if scheme != SHA512Hasher.scheme and not key:
+            raise ValueError('Token hashing scheme {} requires a key'.format(scheme))
+        self.hasher = self.hashers[scheme]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(scheme=settings.get('relocation.token.scheme', 'sha512'),
+                   key=settings.get('relocation.token.key', ''),
+                   iterations=int(settings.get('relocation.token.iterations', 1000)))
+
+    @timed('hash_token')
+    def hash(self, token):
+        """ Hash token with configured scheme
+        :param token: plain token
+        :return: stored representation of token
+        """
+        return self.hasher.encode(to_bytes(token))
+
+    @timed('verify_token')
+    def verify(self, stored, token):
+        """ Check token against stored hash
+        :param stored: stored representation of token
+        :param token: plain token presented by client
+        :return: True if token matches
+        """
+        if not stored or not token:
+            return False
+        stored = to_bytes(stored)
+        if stored.startswith('$'):
+            hasher = self.hashers.get(stored.split('$')[1])
+        else:
+            hasher = self.hashers[SHA512Hasher.scheme]
+        hasher = hasher and hasher.parse(stored)
+        if hasher is None:
+            return False
+        return hmac.compare_digest(stored, hasher.encode(to_bytes(token)))
+
+
+class TokenPool(object):
+    """ Pool of pre-generated ownership tokens
+
+    Items are (access_token, access_token_hash, transfer_token,
+    transfer_token_hash). Access token hash is plain sha512 (it is checked by
+    openprocurement.api), transfer token is hashed with the verifier.
+    The pool is filled by `threads` background threads started on first use
+    (so they are started in every worker process after fork). Empty pool
+    generates items on the caller thread. With gevent monkey patching the
+    threads are greenlets filling the pool between requests, they yield after
+    each generated item.
+    """
+
+    def __init__(self, verifier, size=0, threads=1):
+        self.verifier = verifier
+        self.size = size
+        self.threads = threads
+        self.queue = Queue(maxsize=size)
+        self.lock = Lock()
+        self.pid = None
+
+    @classmethod
+    def from_settings(cls, verifier, settings):
+        return cls(verifier, size=int(settings.get('relocation.token_pool.size', 0)),
+                   threads=int(settings.get('relocation.token_pool.threads', 1)))
+
+    def generate(self):
+        access_token, transfer_token = uuid4().hex, uuid4().hex
+        return (access_token, sha512(access_token).hexdigest(),
+                transfer_token, self.verifier.hash(transfer_token))
+
+    def fill(self):
+        while True:
+            self.queue.put(self.generate())
+            # hashing does not release gil or switch greenlets, so yield
+            # between tokens to serve requests while the pool is refilled
+            sleep(0)
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            for i in range(self.threads):
+                thread = Thread(target=self.fill, name='token-pool-{}'.format(i))
+                thread.daemon = True
+                thread.start()
+
+    def pop(self):
+        """ Get tokens with their hashes
+        :return: (access_token, access_token_hash, transfer_token, transfer_token_hash)
+        """
+        if not self.size:
+            return self.generate()
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            return self.generate()
+
+
+def benchmark(verifier, number=10000):
+    """ Measure hashing cost of verifier
+    :param verifier: TokenVerifier instance
+    :param number: number of iterations
+    :return: dict with microseconds per hash and per verification
+    """
+    token = uuid4().hex
+    stored = verifier.hash(token)
+    return {
+        'hash': timeit(lambda: verifier.hash(token), number=number) * 10 ** 6 / number,
+        'verify': timeit(lambda: verifier.verify(stored, token), number=number) * 10 ** 6 / number,
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Token hashing micro-benchmark')
+    parser.add_argument('-n', '--number', type=int, default=10000)
+    parser.add_argument('-i', '--iterations', type=int, default=1000,
+                        help='iterations of pbkdf2-sha512 scheme')
+    args = parser.parse_args()
+    for scheme in (SHA512Hasher.scheme, HMACSHA512Hasher.scheme, PBKDF2Hasher.scheme):
+        verifier = TokenVerifier(scheme, key='benchmark', iterations=args.iterations)
+        result = benchmark(verifier, args.number)
+        print '{:<16} hash: {:>10.2f} us  verify: {:>10.2f} us'.format(scheme, result['hash'], result['verify'])
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,11 @@ class Root(BaseRoot):
         # (Allow, Everyone, 'view_transfer'),
         (Allow, 'g:brokers', 'view_transfer'),
         (Allow, 'g:brokers', 'create_transfer'),
+        (Allow, 'g:brokers', 'change_ownership'),
+        (Allow, 'g:admins', 'view_relocation_stats'),
+        (Allow, 'g:admins', 'view_relocation_metrics'),
+        (Allow, 'g:admins', 'export_transfers'),
+        (Allow, 'g:admins', 'list_transfers'),
         (Allow, 'g:admins', ALL_PERMISSIONS),
     ]
 
@@ -19,7 +24,20 @@ def factory(request):
     if not request.matchdict or not request.matchdict.get('transfer_id'):
         return root
     request.validated['transfer_id'] = request.matchdict['transfer_id']
-    transfer = request.transfer
+    if request.method == 'GET' and request.if_none_match:
+        # answer conditional request without fetching known transfer document
+        rev = request.get_transfer_revision(request.matchdict['transfer_id'])
+        if rev and rev in request.if_none_match:
+            request.validated['transfer_rev'] = rev
+            return root
+    if request.method == 'GET':
+        # read-only view, full model is not needed
+        transfer = request.transfer_view
+        if request.if_none_match and transfer.rev in request.if_none_match:
+            request.validated['transfer_rev'] = transfer.rev
+            return root
+    else:
+        transfer = request.transfer
     transfer.__parent__ = root
     request.validated['transfer'] = transfer
     request.validated['id'] = request.matchdict['transfer_id']
@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
+import json
 from functools import partial
 from hashlib import sha512
 from pkg_resources import get_distribution
 from logging import getLogger
 from cornice.resource import resource
+from couchdb.http import ResourceNotFound, ResourceConflict, ServerError
 from schematics.exceptions import ModelValidationError
 from openprocurement.api.utils import error_handler, context_unpack
 from openprocurement.api.models import get_now
 
 from openprocurement.relocation.core.traversal import factory
-from openprocurement.relocation.core.models import Transfer
+from openprocurement.relocation.core.models import Transfer, TransferView
+from openprocurement.relocation.core.design import sync_update_handlers, timestamp, transfers_by_usedFor_view
+from openprocurement.relocation.core.timing import timed
+from openprocurement.relocation.core.metrics import count_ownership_change
+from openprocurement.relocation.core.limits import write_slot
+from openprocurement.relocation.core.audit import record_saved_ownership_change
 
 
 transferresource = partial(resource, error_handler=error_handler,
@@ -19,22 +26,115 @@ PKG = get_distribution(__package__)
 LOGGER = getLogger(PKG.project_name)
 
 
+@timed('extract_transfer')
 def extract_transfer(request, transfer_id=None):
     """ Extract transfer from db
     :param request:
     :param transfer_id: uuid4
     :return: transfer as Transfer instance or raise 404
     """
-    db = request.registry.db
+    return request.transfer_from_data(extract_transfer_doc(request, transfer_id))
+
+
+@timed('extract_transfer_view')
+def extract_transfer_view(request, transfer_id=None):
+    """ Extract transfer from db for reading
+    :param request:
+    :param transfer_id: uuid4
+    :return: transfer as TransferView instance or raise 404
+    """
+    return TransferView(extract_transfer_doc(request, transfer_id))
+
+
+def extract_transfer_doc(request, transfer_id=None):
+    """ Get transfer document from cache or db
+    :param request:
+    :param transfer_id: uuid4
+    :return: transfer as dict or raise 404
+    """
+    db = request.registry.transfer_storage
+    cache = request.registry.transfer_cache
     if not transfer_id:
         transfer_id = request.matchdict['transfer_id']
-    doc = db.get(transfer_id)
+    doc = cache.get(transfer_id) if cache else None
+    if doc is None:
+        # used transfers may be moved to archive
+        doc = db.get(transfer_id) or db.get_archived(transfer_id)
+        if cache and doc is not None and doc.get('doc_type') == 'Transfer':
+            cache.set(doc)
     if doc is None or doc.get('doc_type') != 'Transfer':
         request.errors.add('url', 'transfer_id', 'Not Found')
         request.errors.status = 404
         raise error_handler(request.errors)
+    return doc
+
+
+@timed('extract_transfers')
+def extract_transfers(request, ids, batch_size=1000):
+    """ Extract several transfers from db with `_all_docs` requests
+    :param request:
+    :param ids: list of uuid4
+    :param batch_size: number of ids per request
+    :return: list of Transfer instances in order of ids, None for transfers not found
+    """
+    cache = request.registry.transfer_cache
+    docs = {}
+    if cache:
+        for transfer_id in set(ids):
+            doc = cache.get(transfer_id)
+            if doc is not None:
+                docs[transfer_id] = doc
+    missing = sorted(set(ids) - set(docs))
+    for index in range(0, len(missing), batch_size):
+        rows = request.registry.transfer_storage.view(
+            '_all_docs', keys=missing[index:index + batch_size], include_docs=True)
+        for row in rows:
+            doc = row.doc
+            if doc is None or doc.get('doc_type') != 'Transfer':
+                continue
+            docs[row.id] = doc
+            if cache:
+                cache.set(doc)
+    return [request.transfer_from_data(docs[i]) if i in docs else None for i in ids]
+
+
+@timed('extract_transfers_by_location')
+def extract_transfers_by_location(request, location, owner=None):
+    """ Find transfers applied to object location with `transfers/by_usedFor`
+    view (archived transfers are not included)
+    :param request:
+    :param location: normalized location of item (e.g. /tenders/{id}/bids/{id})
+    :param owner: return only transfers owned by owner (the broker who applied them)
+    :return: list of TransferView instances ordered by date
+    """
+    rows = transfers_by_usedFor_view(request.registry.transfer_storage, startkey=[location],
+                                     endkey=[location, {}], include_docs=True)
+    return [
+        TransferView(row.doc) for row in rows
+        if row.doc is not None and (owner is None or row.doc.get('owner') == owner)
+    ]
+
 
-    return request.transfer_from_data(doc)
+@timed('get_transfer_revision')
+def get_transfer_revision(request, transfer_id):
+    """ Get current revision of transfer without fetching the document.
+    Only cached documents are known to be transfers (revision of any
+    document can be found with HEAD request), for others transfer has
+    to be fetched.
+    :param request:
+    :param transfer_id: uuid4
+    :return: revision or None if transfer is not cached
+    """
+    cache = request.registry.transfer_cache
+    doc = cache.get(transfer_id) if cache else None
+    if doc is None:
+        return
+    # cache may be stale (transfer is updated by other process), so the
+    # revision is confirmed with HEAD request
+    rev = request.registry.transfer_storage.revision(transfer_id)
+    if rev != doc['_rev']:
+        cache.invalidate(transfer_id)
+    return rev
 
 
 def transfer_from_data(request, data):
@@ -46,6 +146,7 @@ def transfer_from_data(request, data):
     return Transfer(data)
 
 
+@timed('save_transfer')
 def save_transfer(request):
     """ Save transfer object to database
     :param request:
@@ -53,21 +154,146 @@ def save_transfer(request):
     """
     transfer = request.validated['transfer']
     transfer.date = get_now()
+    cache = request.registry.transfer_cache
+    # HTTP error raised by write_slot must not be caught as storage error
+    with write_slot(request):
+        try:
+            transfer.store(request.registry.transfer_storage)
+        except ModelValidationError, e:  # pragma: no cover
+            for i in e.message:
+                request.errors.add('body', i, e.message[i])
+            request.errors.status = 422
+        except Exception, e:  # pragma: no cover
+            request.errors.add('body', 'data', str(e))
+            if cache and transfer.id:
+                cache.invalidate(transfer.id)
+        else:
+            if cache:
+                # cached after the write, so concurrent readers can't cache older revision
+                cache.set(dict(transfer.to_primitive(), _id=transfer.id, _rev=transfer.rev))
+            LOGGER.info('Saved transfer {}: at {}'.format(
+                transfer.id, get_now().isoformat()),
+                extra=context_unpack(request, {'MESSAGE_ID': 'save_transfer'}))
+            return True
+
+
+@timed('save_transfers')
+def save_transfers(request, transfers):
+    """ Save several transfer objects to database with one bulk request
+    :param request:
+    :param transfers: list of Transfer instances
+    :return: list of errors (None if OK) in the order of transfers
+    """
+    now = get_now()
+    cache = request.registry.transfer_cache
+    results = [None] * len(transfers)
+    docs, indexes = [], []
+    for index, transfer in enumerate(transfers):
+        transfer.date = now
+        try:
+            transfer.validate()
+        except ModelValidationError, e:  # pragma: no cover
+            results[index] = [
+                {'location': 'body', 'name': i, 'description': e.message[i]}
+                for i in e.message
+            ]
+        else:
+            docs.append(transfer.to_primitive())
+            indexes.append(index)
+    if not docs:
+        return results
+    with write_slot(request):
+        try:
+            saved = request.registry.transfer_storage.update(docs)
+        except Exception, e:  # pragma: no cover
+            for index in indexes:
+                results[index] = [{'location': 'body', 'name': 'data', 'description': str(e)}]
+            return results
+    for index, doc, (success, doc_id, rev_or_exc) in zip(indexes, docs, saved):
+        if success:
+            transfer = transfers[index]
+            transfer._id, transfer._rev = doc_id, rev_or_exc
+            if cache:
+                cache.set(dict(doc, _id=doc_id, _rev=rev_or_exc))
+        else:  # pragma: no cover
+            results[index] = [{'location': 'body', 'name': 'data', 'description': str(rev_or_exc)}]
+            if cache:
+                cache.invalidate(doc_id)
+    LOGGER.info('Saved {} of {} transfers: at {}'.format(
+        len([i for i in results if i is None]), len(transfers), get_now().isoformat()),
+        extra=context_unpack(request, {'MESSAGE_ID': 'save_transfers'}))
+    return results
+
+
+def call_use_handler(db, transfer_id, data):
+    """ Call `transfers/use` update handler
+    :param db:
+    :param transfer_id: uuid4
+    :param data: handler parameters (usedFor, date, owner, rev)
+    :return: updated transfer as dict
+    """
+    options = dict(body=json.dumps(data), headers={'Content-Type': 'application/json'})
     try:
-        transfer.store(request.registry.db)
-    except ModelValidationError, e:  # pragma: no cover
-        for i in e.message:
-            request.errors.add('body', i, e.message[i])
-        request.errors.status = 422
-    except Exception, e:  # pragma: no cover
-        request.errors.add('body', 'data', str(e))
-    else:
-        LOGGER.info('Saved transfer {}: at {}'.format(
-            transfer.id, get_now().isoformat()),
-            extra=context_unpack(request, {'MESSAGE_ID': 'save_transfer'}))
-        return True
+        headers, body = db.update_doc('transfers/use', transfer_id, **options)
+    except ResourceNotFound, e:
+        if e.args[0] == ('not_found', 'transfer'):
+            raise
+        # design document was not synced into this database yet
+        sync_update_handlers(db)
+        headers, body = db.update_doc('transfers/use', transfer_id, **options)
+    doc = json.loads(body.read())
+    doc['_rev'] = headers['X-Couch-Update-NewRev']
+    return doc
 
 
+@timed('use_transfer')
+def use_transfer(request, transfer_id, location, owner=None, rev=None, retries=3):
+    """ Set (or reset if location is None) object location of transfer with
+    one request to `transfers/use` update handler
+    :param request:
+    :param transfer_id: uuid4
+    :param location: location of item
+    :param owner: owner transfer must belong to
+    :param rev: expected revision of transfer
+    :param retries: number of retries on update conflicts
+    :return: updated Transfer instance or None
+    """
+    cache = request.registry.transfer_cache
+    data = {'usedFor': location, 'owner': owner, 'rev': rev}
+    for attempt in range(retries + 1):
+        now = get_now()
+        data['date'], data['now'] = now.isoformat(), timestamp(now)
+        try:
+            with write_slot(request):
+                doc = call_use_handler(request.registry.transfer_storage, transfer_id, data)
+        except ResourceNotFound:
+            request.errors.add('url', 'transfer_id', 'Not Found')
+            request.errors.status = 404
+            return
+        except ResourceConflict:
+            if cache:
+                cache.invalidate(transfer_id)
+            if rev is None:
+                # transfer was updated concurrently, handler checks it again
+                continue
+            break
+        except ServerError, e:
+            status, error = e.args[0]
+            if status != 403 or not isinstance(error, tuple):  # pragma: no cover
+                raise
+            request.errors.add('body', 'transfer', error[1])
+            request.errors.status = 403
+            return
+        if cache:
+            cache.set(doc)
+        LOGGER.info('Saved transfer {}: at {}'.format(transfer_id, data['date']),
+                    extra=context_unpack(request, {'MESSAGE_ID': 'save_transfer'}))
+        return request.transfer_from_data(doc)
+    request.errors.add('body', 'transfer', 'Document update conflict.')
+    request.errors.status = 409
+
+
+@timed('set_ownership')
 def set_ownership(item, request, access_token=None, transfer_token=None):
     """ Set ownership for item
     :param item:
@@ -77,8 +303,81 @@ def set_ownership(item, request, access_token=None, transfer_token=None):
     :return: None
     """
     item.owner = request.authenticated_userid
+    # access token is checked by openprocurement.api and must stay plain sha512
     item.access_token = sha512(access_token).hexdigest()
-    item.transfer_token = sha512(transfer_token).hexdigest()
+    item.transfer_token = request.registry.token_verifier.hash(transfer_token)
+
+
+@timed('set_ownership_from_pool')
+def set_ownership_from_pool(item, request):
+    """ Set ownership for item with tokens from token pool
+    :param item:
+    :param request:
+    :return: (access_token, transfer_token) plain tokens
+    """
+    access_token, access_hash, transfer_token, transfer_hash = request.registry.token_pool.pop()
+    item.owner = request.authenticated_userid
+    item.access_token = access_hash
+    item.transfer_token = transfer_hash
+    return access_token, transfer_token
+
+
+def split_location(location):
+    """ Split object location (e.g. /tenders/{id}/bids/{id})
+    :param location: object path
+    :return: (collection, object id, path inside object) or None
+    """
+    path = (location or '').strip('/').split('/')
+    if len(path) < 2 or len(path) % 2 or not all(path):
+        return
+    return path[0], path[1], path[2:]
+
+
+def normalize_location(location):
+    """ Object location in the form stored in `usedFor` of transfers
+    (/tenders/{id}/bids/{id})
+    :param location: object path, leading and trailing slashes are optional
+    :return: normalized location or None if location is invalid
+    """
+    if split_location(location) is None:
+        return
+    return '/' + location.strip('/')
+
+
+def find_item(doc, path):
+    """ Find item inside document by path, e.g. ['bids', '<id>']
+    :param doc: object as dict
+    :param path: list of collection names and item ids
+    :return: item as dict or None
+    """
+    item = doc
+    for collection, item_id in zip(path[::2], path[1::2]):
+        if item is None:
+            return
+        item = next((i for i in item.get(collection, []) if i.get('id') == item_id), None)
+    return item
+
+
+def set_expiration(transfer, request):
+    """ Set expiration time of new transfer if `relocation.expiry.days` is configured
+    :param transfer: Transfer instance
+    :param request:
+    :return: None
+    """
+    ttl = request.registry.transfer_ttl
+    if ttl:
+        transfer.expiresAt = get_now() + ttl
+
+
+def is_expired(doc, now=None):
+    """ Check if unused transfer is expired
+    :param doc: transfer as dict
+    :param now: datetime, current time by default
+    :return: True if expired
+    """
+    if doc.get('usedFor') or not doc.get('expiresAt'):
+        return False
+    return timestamp(doc['expiresAt']) <= timestamp(now or get_now())
 
 
 def update_ownership(item, transfer):
@@ -92,6 +391,7 @@ def update_ownership(item, transfer):
     item.transfer_token = transfer.transfer_token
 
 
+@timed('change_ownership')
 def change_ownership(request, location):
     """ Change ownership for item in request.context
     :param request:
@@ -99,28 +399,32 @@ def change_ownership(request, location):
     :return: True if OK
     """
     data = request.validated['ownership_data']
-    if request.context.transfer_token == sha512(data.get('transfer', '')).hexdigest() \
-            or request.context.get('tender_token') == sha512(data.get('tender_token', '')).hexdigest():
-
-        transfer = extract_transfer(request, transfer_id=data['id'])
-        if data.get('tender_token') and request.context.owner != transfer.owner:
-            request.errors.add('body', 'transfer', 'Only owner is allowed to generate new credentials.')
-            request.errors.status = 403
-            return
-        if transfer.get('usedFor') and transfer.get('usedFor') != location:
-            request.errors.add('body', 'transfer', 'Transfer already used')
-            request.errors.status = 403
-            return
+    verifier = request.registry.token_verifier
+    if verifier.verify(request.context.transfer_token, data.get('transfer')):
+        owner = None
+    elif verifier.verify(request.context.get('tender_token'), data.get('tender_token')):
+        owner = request.context.owner
     else:
         request.errors.add('body', 'transfer', 'Invalid transfer')
         request.errors.status = 403
+        count_ownership_change(request, accepted=False)
+        return
+
+    # transfer is checked (owner, usedFor) and marked as used atomically
+    transfer = use_transfer(request, data['id'], location, owner=owner)
+    if transfer is None:
+        count_ownership_change(request, accepted=False)
+        if request.errors.status == 404:
+            raise error_handler(request.errors)
         return
 
+    previous_owner = request.context.owner
     update_ownership(request.context, transfer)
+    count_ownership_change(request)
+    # object is saved by plugin after the change is applied
+    record_saved_ownership_change(request, transfer.id, location, previous_owner, transfer.owner)
 
-    transfer.usedFor = location
     request.validated['transfer'] = transfer
-    if save_transfer(request):
-        LOGGER.info('Updated transfer relation {}'.format(transfer.id),
-                    extra=context_unpack(request, {'MESSAGE_ID': 'transfer_relation_update'}))
-        return True
+    LOGGER.info('Updated transfer relation {}'.format(transfer.id),
+                extra=context_unpack(request, {'MESSAGE_ID': 'transfer_relation_update'}))
+    return True
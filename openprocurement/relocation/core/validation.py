@@ -1,11 +1,25 @@
 # -*- coding: utf-8 -*-
-from openprocurement.api.utils import update_logging_context
+from schematics.exceptions import ModelValidationError, ModelConversionError
+from openprocurement.api.utils import update_logging_context, error_handler
 from openprocurement.api.validation import validate_json_data, validate_data
 from openprocurement.relocation.core.models import Transfer
+from openprocurement.relocation.core.timing import timed
+from openprocurement.relocation.core.metrics import count_ownership_change
+from openprocurement.relocation.core.utils import split_location
+from openprocurement.relocation.core.limits import check_rate_limit
 
 
+@timed('validate_transfer_data')
 def validate_transfer_data(request):
     update_logging_context(request, {'transfer_id': '__new__'})
+    try:
+        json = request.json_body
+    except ValueError:
+        json = None
+    if isinstance(json, dict) and isinstance(json.get('data'), list):
+        check_rate_limit(request, 'create_transfer', cost=len(json['data']) or 1)
+        return validate_transfer_batch_data(request, json['data'])
+    check_rate_limit(request, 'create_transfer')
     data = validate_json_data(request)
     if data is None:
         return
@@ -13,10 +27,66 @@ def validate_transfer_data(request):
     return validate_data(request, model, data=data)
 
 
+def validate_transfer_batch_data(request, data):
+    limit = request.registry.transfer_batch_limit
+    if not data or len(data) > limit:
+        request.errors.add('body', 'data', 'Batch must contain from 1 to {} transfers.'.format(limit))
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    items = []
+    for item in data:
+        if not isinstance(item, dict):
+            items.append((None, [{'location': 'body', 'name': 'data', 'description': 'Data not available'}]))
+            continue
+        try:
+            model = Transfer(item)
+            model.validate()
+            transfer = Transfer(model.serialize('create'))
+        except (ModelValidationError, ModelConversionError), e:
+            items.append((None, [
+                {'location': 'body', 'name': i, 'description': e.message[i]}
+                for i in e.message
+            ]))
+        else:
+            items.append((transfer, None))
+    request.validated['transfers'] = items
+    return items
+
+
+@timed('validate_ownership_batch_data')
+def validate_ownership_batch_data(request):
+    try:
+        json = request.json_body
+    except ValueError:
+        json = None
+    data = json.get('data') if isinstance(json, dict) else None
+    limit = request.registry.transfer_batch_limit
+    if not isinstance(data, list) or not data or len(data) > limit:
+        request.errors.add('body', 'data', 'Batch must contain from 1 to {} ownership changes.'.format(limit))
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    check_rate_limit(request, 'change_ownership', cost=len(data))
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            request.errors.add('body', 'data.{}'.format(index), 'Data not available')
+            continue
+        for field in ['location', 'id', 'transfer']:
+            if not item.get(field) or not isinstance(item[field], basestring):
+                request.errors.add('body', 'data.{}.{}'.format(index, field), 'This field is required.')
+        if isinstance(item.get('location'), basestring) and split_location(item['location']) is None:
+            request.errors.add('body', 'data.{}.location'.format(index), 'Invalid location.')
+    if request.errors:
+        request.errors.status = 422
+        return
+    request.validated['ownership_batch'] = data
+
+
+@timed('validate_set_or_change_ownership_data')
 def validate_set_or_change_ownership_data(request):
     if request.errors:
         # do not run validation if some errors are already detected
         return
+    check_rate_limit(request, 'change_ownership')
     data = validate_json_data(request)
     fields_set = set(['id', 'transfer', 'tender_token'])
     request_set = set([field for field in fields_set if data.get(field)])
@@ -32,10 +102,12 @@ def validate_set_or_change_ownership_data(request):
     request.validated['ownership_data'] = data
 
 
+@timed('validate_ownership_data')
 def validate_ownership_data(request):
     if request.errors:
         # do not run validation if some errors are already detected
         return
+    check_rate_limit(request, 'change_ownership')
     data = validate_json_data(request)
 
     for field in ['id', 'transfer']:
@@ -47,14 +119,22 @@ def validate_ownership_data(request):
     request.validated['ownership_data'] = data
 
 
-def validate_accreditation_level(request, item, level_name):
+def check_accreditation_level(request, item, level_name):
+    """ Check broker accreditation for ownership change of item
+    :return: (name, description) of error or None
+    """
     level = getattr(type(item), level_name)
     if not request.check_accreditation(level):
-        request.errors.add('procurementMethodType', 'accreditation', 'Broker Accreditation level does not permit ownership change')
-        request.errors.status = 403
-        return
+        return 'accreditation', 'Broker Accreditation level does not permit ownership change'
 
     if item.get('mode', None) is None and request.check_accreditation('t'):
-        request.errors.add('procurementMethodType', 'mode', 'Broker Accreditation level does not permit ownership change')
+        return 'mode', 'Broker Accreditation level does not permit ownership change'
+
+
+@timed('validate_accreditation_level')
+def validate_accreditation_level(request, item, level_name):
+    error = check_accreditation_level(request, item, level_name)
+    if error:
+        request.errors.add('procurementMethodType', error[0], error[1])
         request.errors.status = 403
-        return
+        count_ownership_change(request, accepted=False)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from cornice.service import Service
+from openprocurement.api.utils import error_handler
+
+from openprocurement.relocation.core.scripts.export import PROJECTIONS, iter_transfers, export_lines
+from openprocurement.relocation.core.traversal import factory
+
+
+export = Service(name='RelocationExport',
+                 path='/relocation/export',
+                 error_handler=error_handler,
+                 factory=factory,
+                 description="Transfers export")
+
+
+@export.get(permission='export_transfers')
+def get_export(request):
+    """ Stream all transfers as NDJSON, `projection` is `view` (default) or `full` """
+    projection = request.params.get('projection', 'view')
+    if projection not in PROJECTIONS:
+        request.errors.add('url', 'projection', 'Value must be one of {}.'.format(', '.join(PROJECTIONS)))
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    response = request.response
+    response.content_type = 'application/x-ndjson'
+    response.app_iter = export_lines(iter_transfers(request.registry.transfer_storage), projection)
+    return response
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from cornice.service import Service
+from openprocurement.api.utils import error_handler
+
+from openprocurement.relocation.core.traversal import factory
+from openprocurement.relocation.core.utils import normalize_location
+
+
+location = Service(name='RelocationLocation',
+                   path='/relocation/location',
+                   renderer='json',
+                   error_handler=error_handler,
+                   factory=factory,
+                   description="Transfers applied to object location")
+
+
+@location.get(permission='view_transfer')
+def get_location_transfers(request):
+    """ Transfers applied to object at `location` (e.g. /tenders/{id}),
+    brokers get only transfers they own (owner of transfer, which is
+    the new owner of the object)
+    """
+    path = normalize_location(request.params.get('location', ''))
+    if path is None:
+        request.errors.add('url', 'location', 'Invalid location.')
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    owner = None if 'g:admins' in request.effective_principals else request.authenticated_userid
+    transfers = request.extract_transfers_by_location(path, owner=owner)
+    return {'data': [i.serialize('view') for i in transfers]}
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from cornice.service import Service
+from openprocurement.api.utils import error_handler
+
+from openprocurement.relocation.core.traversal import factory
+
+
+metrics = Service(name='RelocationMetrics',
+                  path='/relocation/metrics',
+                  error_handler=error_handler,
+                  factory=factory,
+                  description="Relocation metrics")
+
+
+@metrics.get(permission='view_relocation_metrics')
+def get_metrics(request):
+    """ Metrics in Prometheus text exposition format """
+    response = request.response
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.body = request.registry.transfer_metrics.render().encode('utf-8')
+    return response
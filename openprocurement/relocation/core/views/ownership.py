@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from cornice.service import Service
+from openprocurement.api.utils import error_handler
+
+from openprocurement.relocation.core.ownership import change_ownership_batch
+from openprocurement.relocation.core.traversal import factory
+from openprocurement.relocation.core.validation import validate_ownership_batch_data
+
+
+ownership = Service(name='RelocationOwnership',
+                    path='/relocation/ownership',
+                    renderer='json',
+                    error_handler=error_handler,
+                    factory=factory,
+                    description="Batch ownership change")
+
+
+@ownership.post(permission='change_ownership', content_type="application/json",
+                validators=(validate_ownership_batch_data,))
+def post_ownership(request):
+    """ Change ownership of objects from `data` list of
+    {"location": ..., "id": <transfer id>, "transfer": <object transfer token>}
+    """
+    results = change_ownership_batch(request, request.validated['ownership_batch'])
+    request.response.status = 200 if [i for i in results if i['status'] == 200] else 422
+    return {'data': results}
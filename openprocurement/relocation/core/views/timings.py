@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from cornice.service import Service
+from openprocurement.api.utils import error_handler
+
+from openprocurement.relocation.core.traversal import factory
+
+
+timings = Service(name='RelocationTimings',
+                  path='/relocation/timings',
+                  renderer='json',
+                  error_handler=error_handler,
+                  factory=factory,
+                  description="Relocation stage timings")
+
+
+@timings.get(permission='view_relocation_stats')
+def get_timings(request):
+    """ Aggregated histograms of stage durations (milliseconds) """
+    return {'data': request.registry.transfer_timings.report()}
+
+
+@timings.delete(permission='view_relocation_stats')
+def reset_timings(request):
+    request.registry.transfer_timings.clear()
+    return {'data': {}}
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
+from functools import partial
+from pyramid.httpexceptions import HTTPNotModified
+from openprocurement.relocation.core.design import (
+    FIELDS, transfers_by_date_view, transfers_by_owner_view
+)
 from openprocurement.relocation.core.validation import validate_transfer_data
 from openprocurement.relocation.core.utils import (
-    transferresource, save_transfer, set_ownership
+    transferresource, save_transfer, save_transfers, set_ownership_from_pool, set_expiration
 )
-from openprocurement.api.utils import json_view, context_unpack, APIResource
+from openprocurement.api.utils import json_view, context_unpack, error_handler, APIResource
 
 
 @transferresource(name='Transfers',
@@ -13,22 +18,108 @@ from openprocurement.api.utils import json_view, context_unpack, APIResource
 class TransferResource(APIResource):
     """ Resource handler for Transfers """
 
+    @json_view(permission='view_transfer')
+    def collection_get(self):
+        # http://wiki.apache.org/couchdb/HTTP_view_API#Querying_Options
+        params = {}
+        pparams = {}
+        fields = self.request.params.get('opt_fields', '')
+        if fields:
+            params['opt_fields'] = fields
+            pparams['opt_fields'] = fields
+        fields = [i for i in fields.split(',') if i in FIELDS]
+        limit = self.request.params.get('limit', '')
+        if limit:
+            params['limit'] = limit
+            pparams['limit'] = limit
+        limit = int(limit) if limit.isdigit() and 1000 >= int(limit) > 0 else 100
+        descending = bool(self.request.params.get('descending'))
+        if descending:
+            params['descending'] = 1
+        else:
+            pparams['descending'] = 1
+        # offset is "<date>|<id>" of the last seen row, transfers created
+        # with one bulk request share the same date
+        offset = self.request.params.get('offset', '')
+        view_offset, _, view_offset_docid = offset.partition('|')
+        if not view_offset:
+            view_offset = '9' if descending else ''
+        view_options = dict(limit=limit + 1 if offset else limit, startkey=view_offset, descending=descending)
+        if view_offset_docid:
+            view_options['startkey_docid'] = view_offset_docid
+        if self.update_after:
+            view_options['stale'] = 'update_after'
+        storage = self.request.registry.transfer_storage
+        mode = self.request.params.get('mode', '')
+        if mode == 'pending':
+            # unused transfers of authenticated broker
+            params['mode'] = mode
+            pparams['mode'] = mode
+            prefix = [self.request.authenticated_userid, True]
+            view_options['startkey'] = prefix + [view_offset]
+            view_options['endkey'] = prefix if descending else prefix + [{}]
+            view = partial(transfers_by_owner_view, storage, **view_options)
+            date_key = lambda x: x.key[-1]
+        elif self.request.has_permission('list_transfers', self.context):
+            # all transfers with locations they are used for
+            view = partial(transfers_by_date_view, storage, **view_options)
+            date_key = lambda x: x.key
+        else:
+            self.request.errors.add('url', 'mode', 'Only pending transfers of broker can be listed.')
+            self.request.errors.status = 403
+            raise error_handler(self.request.errors)
+        results = [
+            (dict([(i, j) for i, j in (x.value or {}).items() if i in fields] + [('id', x.id), ('date', date_key(x))]),
+             u'{}|{}'.format(date_key(x), x.id))
+            for x in view()
+        ]
+        if results and offset and results[0][1] == offset:
+            results = results[1:]
+        else:
+            results = results[:limit]
+        if results:
+            params['offset'], pparams['offset'] = results[-1][1], results[0][1]
+            results = [i[0] for i in results]
+        else:
+            params['offset'] = offset
+            pparams['offset'] = offset
+        data = {
+            'data': results,
+            'next_page': {
+                "offset": params['offset'],
+                "path": self.request.route_path('collection_Transfers', _query=params),
+                "uri": self.request.route_url('collection_Transfers', _query=params)
+            }
+        }
+        if descending or offset:
+            data['prev_page'] = {
+                "offset": pparams['offset'],
+                "path": self.request.route_path('collection_Transfers', _query=pparams),
+                "uri": self.request.route_url('collection_Transfers', _query=pparams)
+            }
+        return data
+
     @json_view(permission='view_transfer')
     def get(self):
-        return {'data': self.request.validated['transfer'].serialize("view")}
+        if 'transfer_rev' in self.request.validated:
+            return HTTPNotModified(etag=self.request.validated['transfer_rev'])
+        transfer = self.request.validated['transfer']
+        self.request.response.etag = transfer.rev
+        return {'data': transfer.serialize("view")}
 
     @json_view(content_type="application/json", permission='create_transfer',
                validators=(validate_transfer_data,))
     def collection_post(self):
+        if 'transfers' in self.request.validated:
+            return self.create_transfers()
         transfer = self.request.validated['transfer']
 
-        access_token = transfer.access_token
-        transfer_token = transfer.transfer_token
-        set_ownership(transfer, self.request, access_token=access_token,
-                      transfer_token=transfer_token)
+        access_token, transfer_token = set_ownership_from_pool(transfer, self.request)
+        set_expiration(transfer, self.request)
 
         self.request.validated['transfer'] = transfer
         if save_transfer(self.request):
+            self.request.registry.transfer_metrics['relocation_transfers_created_total'].inc()
             self.LOGGER.info('Created transfer {}'.format(transfer.id),
                              extra=context_unpack(
                                  self.request,
@@ -42,3 +133,38 @@ class TransferResource(APIResource):
                     'transfer': transfer_token,
                 }
             }
+
+    def create_transfers(self):
+        """ Create transfers from `data` list with one bulk write """
+        items = self.request.validated['transfers']
+        transfers, tokens = [], []
+        for transfer, errors in items:
+            if transfer is None:
+                continue
+            tokens.append(set_ownership_from_pool(transfer, self.request))
+            set_expiration(transfer, self.request)
+            transfers.append(transfer)
+
+        saved = iter(zip(transfers, tokens, save_transfers(self.request, transfers)))
+        results = []
+        for transfer, errors in items:
+            if transfer is not None:
+                transfer, (access_token, transfer_token), errors = next(saved)
+            if errors:
+                results.append({'status': 422, 'errors': errors})
+                continue
+            results.append({
+                'status': 201,
+                'data': transfer.serialize("view"),
+                'access': {
+                    'token': access_token,
+                    'transfer': transfer_token,
+                }
+            })
+
+        created = len([i for i in results if i['status'] == 201])
+        self.request.registry.transfer_metrics['relocation_transfers_created_total'].inc(created)
+        self.LOGGER.info('Created {} of {} transfers'.format(created, len(results)),
+                         extra=context_unpack(self.request, {'MESSAGE_ID': 'transfer_batch_create'}))
+        self.request.response.status = 201 if created else 422
+        return {'data': results}
@@ -17,9 +17,21 @@ docs_requires = requires + [
     'sphinxcontrib-httpdomain',
 ]
 
+benchmark_requires = [
+    'webtest',
+]
+
 entry_points = {
     'openprocurement.api.plugins': [
         'relocation.core = openprocurement.relocation.core.includeme:main'
+    ],
+    'console_scripts': [
+        'relocation_token_benchmark = openprocurement.relocation.core.tokens:main',
+        'relocation_reconcile = openprocurement.relocation.core.scripts.reconcile:main',
+        'relocation_benchmark = openprocurement.relocation.core.scripts.benchmark:main [benchmark]',
+        'relocation_export = openprocurement.relocation.core.scripts.export:main',
+        'relocation_archive = openprocurement.relocation.core.scripts.archive:main',
+        'relocation_expire = openprocurement.relocation.core.scripts.expire:main',
     ]
 }
 
@@ -46,6 +58,6 @@ setup(name='openprocurement.relocation.core',
       zip_safe=False,
       install_requires=requires,
       tests_require=test_requires,
-      extras_require={'test': test_requires, 'docs': docs_requires},
+      extras_require={'test': test_requires, 'docs': docs_requires, 'benchmark': benchmark_requires},
       entry_points=entry_points,
       )